@@ -30,7 +30,14 @@ For example, bowling([10, 7, 3, ...]) means that you get a strike, you score
 10 + 7 + 3 = 20 in the first frame; the second frame starts with the 7.
 
 """
+import heapq
+import random
+from array import array
+from collections import namedtuple
+from fractions import gcd
+
 FRAMES = 10
+MAX_BALLS = 21 # nine open frames plus a three ball tenth frame
 # Main() : Compute the total score for a player's game of bowling.
 def bowling(balls,debug=False):
     score = 0
@@ -73,6 +80,342 @@ def isSpare(index,balls):
         spare_score += balls[i]
     return spare_score == 10
 
+def score_balls(balls, start=0, end=None):
+    "Score the game stored in balls[start:end] without copying it. Balls past the end count as 0."
+    if end is None:
+        end = len(balls)
+    score = 0
+    index = start
+    for frame in xrange(FRAMES):
+        if index >= end:
+            break
+        first = balls[index]
+        second = balls[index+1] if index+1 < end else 0
+        if first == 10: # strike: the next two balls count as a bonus
+            score += 10 + second + (balls[index+2] if index+2 < end else 0)
+            index += 1
+        elif first + second == 10: # spare: the next ball counts as a bonus
+            score += 10 + (balls[index+2] if index+2 < end else 0)
+            index += 2
+        else:
+            score += first + second
+            index += 2
+    return score
+
+def bowling_batch(rolls_matrix):
+    "Score many games at once. Each row of rolls_matrix is one game, optionally padded with 0s up to MAX_BALLS."
+    return array('H', [score_balls(row) for row in rolls_matrix])
+
+# Columnar scorecards for n games: totals has one entry per game, the other fields FRAMES entries per game.
+Scorecards = namedtuple('Scorecards', 'totals cumulative strikes spares offsets')
+
+def scorecards(rolls_matrix):
+    """Score many games in one pass, returning Scorecards of arrays: the running total after each frame,
+    strike and spare flags per frame, and the index of the first ball of each frame."""
+    totals, cumulative = array('H'), array('H')
+    strikes, spares, offsets = array('B'), array('B'), array('B')
+    for balls in rolls_matrix:
+        end = len(balls)
+        score = 0
+        index = 0
+        for frame in xrange(FRAMES):
+            offsets.append(index)
+            first = balls[index] if index < end else 0
+            second = balls[index+1] if index+1 < end else 0
+            strike = first == 10
+            spare = not strike and first + second == 10
+            if strike or spare:
+                score += first + second + (balls[index+2] if index+2 < end else 0)
+            else:
+                score += first + second
+            index += 1 if strike else 2
+            cumulative.append(score)
+            strikes.append(strike)
+            spares.append(spare)
+        totals.append(score)
+    return Scorecards(totals, cumulative, strikes, spares, offsets)
+
+class BowlingGame(object):
+    "A game in progress. Each roll() updates the total, the frame scores and the pending bonuses in O(1)."
+    __slots__ = ('score', 'frames', 'frame', 'ball', 'standing', 'fill', 'pending')
+
+    def __init__(self):
+        self.score = 0
+        self.frames = [0] * FRAMES # points earned by each frame so far
+        self.frame = 1
+        self.ball = 1 # ball number within the current frame
+        self.standing = 10
+        self.fill = False # the tenth frame has earned its third ball
+        self.pending = [] # [frame index, balls still owed] for each unpaid strike or spare bonus
+
+    def over(self):
+        return self.frame > FRAMES
+
+    def roll(self, pins):
+        if self.over():
+            raise ValueError('the game is over')
+        if not 0 <= pins <= self.standing:
+            raise ValueError('%s pins rolled with %s standing' % (pins, self.standing))
+        for bonus in self.pending: # at most two bonuses are ever pending
+            self.frames[bonus[0]] += pins
+            self.score += pins
+            bonus[1] -= 1
+        if self.pending and self.pending[0][1] == 0:
+            self.pending.pop(0)
+        self.frames[self.frame-1] += pins
+        self.score += pins
+        standing = self.standing - pins
+        if self.frame < FRAMES:
+            if standing == 0:
+                self.pending.append([self.frame-1, 2 if self.ball == 1 else 1])
+            if standing == 0 or self.ball == 2:
+                self.frame, self.ball, self.standing = self.frame + 1, 1, 10
+            else:
+                self.ball, self.standing = 2, standing
+        elif self.ball == 1: # tenth frame: no more bonuses, a strike or spare earns a third ball
+            self.fill = standing == 0
+            self.ball, self.standing = 2, standing or 10
+        elif self.ball == 2 and (self.fill or standing == 0):
+            self.fill = True
+            self.ball, self.standing = 3, standing or 10
+        else:
+            self.frame += 1
+        return self.score
+
+    def state(self):
+        "The frame state that decides how the rest of the game can score (see roll_outcomes), or None once over."
+        if self.over():
+            return None
+        bonus1 = len(self.pending)
+        bonus2 = sum(1 for bonus in self.pending if bonus[1] == 2)
+        return (self.frame, self.ball, self.standing, self.fill, bonus1, bonus2)
+
+    def max_score(self):
+        "The best final score this game can still reach."
+        return self.score + _max_rest(self.state())
+
+# A frame state is (frame, ball, standing, fill, bonus1, bonus2): the frame and ball number about to be
+# rolled, the pins standing, whether the tenth frame has earned its third ball, and how many pending
+# strike/spare bonuses the next ball and the ball after it will pay.
+START = (1, 1, 10, False, 0, 0)
+_OUTCOMES = {}
+
+def roll_outcomes(state):
+    "List of (pins, points, next_state) for every legal next ball; next_state is None when the game ends."
+    if state in _OUTCOMES:
+        return _OUTCOMES[state]
+    frame, ball, standing, fill, bonus1, bonus2 = state
+    outcomes = []
+    for pins in xrange(standing + 1):
+        left = standing - pins
+        if frame < FRAMES:
+            if ball == 1 and left == 0: # strike
+                next_state = (frame+1, 1, 10, False, bonus2+1, 1)
+            elif ball == 1:
+                next_state = (frame, 2, left, False, bonus2, 0)
+            else: # spare or open frame
+                next_state = (frame+1, 1, 10, False, bonus2 + (left == 0), 0)
+        elif ball == 1:
+            next_state = (frame, 2, left or 10, left == 0, bonus2, 0)
+        elif ball == 2 and (fill or left == 0):
+            next_state = (frame, 3, left or 10, True, 0, 0)
+        else:
+            next_state = None
+        outcomes.append((pins, pins * (1 + bonus1), next_state))
+    _OUTCOMES[state] = outcomes
+    return outcomes
+
+def uniform_model(standing):
+    "Every number of pins from 0 to standing is equally likely."
+    return [1.0 / (standing + 1)] * (standing + 1)
+
+def score_distribution(model, game=None):
+    """Exact distribution of the final score as {score: probability}. model(standing) gives the
+    probability of knocking down 0..standing pins. If game is given, start from its current state."""
+    memo = {}
+    if game is None:
+        return _distribution(START, model, memo)
+    rest = _distribution(game.state(), model, memo)
+    return dict((game.score + score, p) for (score, p) in rest.iteritems())
+
+def _distribution(state, model, memo):
+    "Distribution of the points still to come from state, memoized in memo."
+    if state is None:
+        return {0: 1}
+    if state not in memo:
+        dist = {}
+        chances = model(state[2])
+        for pins, points, next_state in roll_outcomes(state):
+            p = chances[pins]
+            if p:
+                for score, q in _distribution(next_state, model, memo).iteritems():
+                    dist[score+points] = dist.get(score+points, 0) + p * q
+        memo[state] = dist
+    return memo[state]
+
+_COUNTS = {} # state -> {points still to come: number of ways}
+
+def _every_ball(standing):
+    return [1] * (standing + 1)
+
+def count_games(score):
+    "Number of distinct legal roll sequences whose final score is score."
+    return _distribution(START, _every_ball, _COUNTS).get(score, 0)
+
+def games_with_score(score):
+    "Lazily generate every legal roll sequence whose final score is score."
+    def extend(state, target, balls):
+        if state is None:
+            yield list(balls)
+            return
+        for pins, points, next_state in roll_outcomes(state):
+            if target - points in _distribution(next_state, _every_ball, _COUNTS):
+                balls.append(pins)
+                for game in extend(next_state, target - points, balls):
+                    yield game
+                balls.pop()
+    return extend(START, score, [])
+
+RANDOM_BLOCK = 1 << 16 # games sampled at a time by random_packed_games
+_FRAME_DRAWS = {} # frame -> (balls, table): frame i is rolled balls[table[r]] for r uniform in range(len(table))
+
+def _frame_draws(frame):
+    """Every way to roll frame as a string of ball bytes, and a table that picks one of them as often as
+    rolling each ball uniformly would: a way to roll it with odds of 1 in k fills len(table)/k entries."""
+    if frame not in _FRAME_DRAWS:
+        rolls = [] # (ball bytes, k)
+        def extend(state, balls, k):
+            if state is None or state[0] != frame:
+                rolls.append((array('B', balls).tostring(), k))
+                return
+            outcomes = roll_outcomes(state)
+            for (pins, _, next_state) in outcomes:
+                extend(next_state, balls + [pins], k * len(outcomes))
+        extend((frame, 1, 10, False, 0, 0), [], 1)
+        size = reduce(lambda a, b: a * b // gcd(a, b), [k for (_, k) in rolls])
+        table = array('B')
+        for (i, (_, k)) in enumerate(rolls):
+            table.extend(array('B', [i]) * (size // k))
+        _FRAME_DRAWS[frame] = ([balls for (balls, _) in rolls], table)
+    return _FRAME_DRAWS[frame]
+
+def _draw_frames(rng, frame, n):
+    "n random rolls of frame, as strings of ball bytes; 32 random bits a draw, the few past a whole table redrawn."
+    rolls, table = _frame_draws(frame)
+    size = len(table)
+    limit = size * ((1 << 32) // size) - (1 << 31) # draws are signed, so they index as plain ints
+    drawn = []
+    while len(drawn) < n:
+        k = n - len(drawn)
+        words = array('i')
+        words.fromstring(('%0*x' % (8 * k, rng.getrandbits(32 * k))).decode('hex'))
+        if max(words) >= limit: # rare: size does not divide 2**32
+            words = array('i', [r for r in words if r < limit])
+        drawn.extend(map(rolls.__getitem__, map(table.__getitem__, map(size.__rmod__, words))))
+    return drawn
+
+def random_packed_games(n, seed=None, block_games=RANDOM_BLOCK):
+    """Generate n random legal games in blocks of (balls, lengths) arrays, laid out as bowling_packed does;
+    each ball knocks down 0..standing pins uniformly. Frames are drawn whole, the first nine from one table."""
+    rng = random.Random(seed)
+    for first in xrange(0, n, block_games):
+        k = min(block_games, n - first)
+        if not k:
+            break
+        opening = _draw_frames(rng, 1, (FRAMES - 1) * k)
+        frames = [opening[f*k:(f+1)*k] for f in xrange(FRAMES - 1)] + [_draw_frames(rng, FRAMES, k)]
+        games = map(''.join, zip(*frames)) # game g rolls frames[0][g], frames[1][g], ...
+        yield array('B', ''.join(games)), array('B', map(len, games))
+
+def random_games(n, seed=None):
+    "Generate n random legal games (lists of balls), unpacked from random_packed_games(n, seed)."
+    for balls, lengths in random_packed_games(n, seed):
+        start = 0
+        for length in lengths:
+            yield balls[start:start+length].tolist()
+            start += length
+
+_MAX_REST = {}
+
+def _max_rest(state):
+    "Most points still to come from state."
+    if state is None:
+        return 0
+    if state not in _MAX_REST:
+        _MAX_REST[state] = max(points + _max_rest(next_state) for (_, points, next_state) in roll_outcomes(state))
+    return _MAX_REST[state]
+
+class Leaderboard(object):
+    """The k games with the best current score, kept up to date as balls are rolled.
+    A game whose max_score() cannot beat the k-th best score is marked hopeless and is never re-ranked:
+    scores only go up, so the k-th best score never goes down."""
+
+    def __init__(self, k):
+        self.k = k
+        self.games = {} # player -> BowlingGame
+        self.top = set()
+        self.heap = [] # (score, player) for the top players; out of date entries are skipped lazily
+        self.hopeless = set()
+
+    def roll(self, player, pins):
+        if player not in self.games:
+            self.games[player] = BowlingGame()
+        game = self.games[player]
+        score = game.roll(pins)
+        if player in self.hopeless:
+            pass
+        elif player in self.top:
+            if pins:
+                heapq.heappush(self.heap, (score, player))
+                if len(self.heap) > 4 * self.k:
+                    self.heap = [(self.games[p].score, p) for p in self.top]
+                    heapq.heapify(self.heap)
+        elif len(self.top) < self.k:
+            self.top.add(player)
+            heapq.heappush(self.heap, (score, player))
+        else:
+            threshold = self.threshold()
+            if score > threshold:
+                evicted = heapq.heappop(self.heap)[1]
+                self.top.remove(evicted)
+                if self.games[evicted].over():
+                    del self.games[evicted]
+                self.top.add(player)
+                heapq.heappush(self.heap, (score, player))
+            elif game.max_score() <= threshold:
+                self.hopeless.add(player)
+        if game.over() and player in self.hopeless: # nothing left to track
+            del self.games[player]
+            self.hopeless.remove(player)
+        return score
+
+    def threshold(self):
+        "The k-th best current score: a game must beat it to enter the leaderboard."
+        heap = self.heap
+        while heap[0][1] not in self.top or heap[0][0] != self.games[heap[0][1]].score:
+            heapq.heappop(heap)
+        return heap[0][0]
+
+    def leaders(self):
+        "List of (score, player) for the top games, best first."
+        return sorted(((self.games[p].score, p) for p in self.top), reverse=True)
+
+TEST_GAMES = [
+    (  0, [0] * 20),
+    ( 20, [1] * 20),
+    ( 80, [4] * 20),
+    (190, [9,1] * 10 + [9]),
+    (300, [10] * 12),
+    (200, [10, 5,5] * 5 + [10]),
+    ( 11, [0,0] * 9 + [10,1,0]),
+    ( 12, [0,0] * 8 + [10, 1,0]),
+    (168, [9, 1, 0, 10, 10, 10, 6, 2, 7, 3, 8, 2, 10, 9, 0, 9, 1, 10]),
+    ( 60, [3]*20),
+    ( 67, [8,2] + [3]*18),
+    ( 70, [10] + [3]*18),
+    (147, [8,2]*2 + [7]*16),
+    ]
+
 def test_bowling():
     assert   0 == bowling([0] * 20)
     assert  20 == bowling([1] * 20)
@@ -90,5 +433,143 @@ def test_bowling():
     assert 190 == bowling([9,1] * 10 + [9])
     print 'tests pass'
 
+def test_bowling_batch():
+    padded = [balls + [0] * (MAX_BALLS - len(balls)) for (_,balls) in TEST_GAMES]
+    assert list(bowling_batch(padded)) == [score for (score,_) in TEST_GAMES]
+    assert list(bowling_batch(balls for (_,balls) in TEST_GAMES)) == [bowling(balls) for (_,balls) in TEST_GAMES]
+    assert list(bowling_batch([])) == []
+    assert 90 == score_balls([7] + [9,0] * 10 + [7], 1, 21)
+    print 'batch tests pass'
+
+def test_bowling_game():
+    for (score,balls) in TEST_GAMES[:-1]: # the last game knocks down 14 pins per frame
+        game = BowlingGame()
+        totals = [game.roll(pins) for pins in balls]
+        assert game.over() and totals[-1] == score == sum(game.frames)
+        assert totals == sorted(totals)
+    game = BowlingGame()
+    for pins in [10] * 12:
+        game.roll(pins)
+    assert game.frames == [30] * 10 and game.pending == []
+    game = BowlingGame()
+    assert [game.roll(pins) for pins in [10, 7, 3, 4]] == [10, 24, 30, 38]
+    assert game.frames[:3] == [20, 14, 4] and (game.frame, game.ball, game.standing) == (3, 2, 6)
+    assert not hasattr(game, '__dict__')
+    for bad in ([11], [5, 6], [0] * 21):
+        game = BowlingGame()
+        try:
+            for pins in bad:
+                game.roll(pins)
+            assert False, bad
+        except ValueError:
+            pass
+    print 'game tests pass'
+
+def test_score_distribution():
+    from fractions import Fraction
+    assert score_distribution(lambda standing: [0] * standing + [1]) == {300: 1}
+    assert score_distribution(lambda standing: [1] + [0] * standing) == {0: 1}
+    def all_or_nothing(standing):
+        return [Fraction(1, 2)] + [0] * (standing - 1) + [Fraction(1, 2)]
+    def games(state, balls): # every game the all_or_nothing model can roll
+        if state is None:
+            yield balls
+        else:
+            for pins, _, next_state in roll_outcomes(state):
+                if pins in (0, state[2]):
+                    for game in games(next_state, balls + [pins]):
+                        yield game
+    game = BowlingGame()
+    prefix = [3, 7, 0, 0, 10, 10] # four frames in, with two strike bonuses still owed
+    for pins in prefix:
+        game.roll(pins)
+    expected = {}
+    for balls in games(game.state(), prefix):
+        score = bowling(balls)
+        expected[score] = expected.get(score, 0) + Fraction(1, 2) ** (len(balls) - len(prefix))
+    assert score_distribution(all_or_nothing, game) == expected
+    dist = score_distribution(uniform_model)
+    assert abs(sum(dist.values()) - 1) < 1e-9 and max(dist) == 300 and min(dist) == 0
+    game = BowlingGame()
+    for pins in [10] * 11:
+        game.roll(pins)
+    assert game.state() == (10, 3, 10, True, 0, 0)
+    assert score_distribution(uniform_model, game) == dict((290 + pins, 1.0 / 11) for pins in range(11))
+    print 'distribution tests pass'
+
+def test_count_games():
+    assert (count_games(0), count_games(1), count_games(2)) == (1, 20, 210)
+    assert count_games(300) == 1 and count_games(301) == 0 and count_games(-1) == 0
+    for score in (0, 1, 2, 3, 290, 299, 300):
+        games = list(games_with_score(score))
+        assert len(games) == count_games(score) == len(set(map(tuple, games)))
+        assert all(bowling(balls) == score for balls in games)
+    assert next(games_with_score(150)) and bowling(next(games_with_score(150))) == 150
+    assert sum(count_games(score) for score in range(301)) > 10 ** 18
+    print 'count tests pass'
+
+def test_leaderboard():
+    rng = random.Random(212)
+    assert BowlingGame().max_score() == 300
+    players = dict((name, list(next(games_with_score(rng.randrange(301))))) for name in range(60))
+    for balls in players.values():
+        game = BowlingGame()
+        for pins in balls:
+            assert game.max_score() >= bowling(balls)
+            game.roll(pins)
+        assert game.max_score() == bowling(balls)
+    board = Leaderboard(5)
+    scores = {}
+    while players:
+        name = rng.choice(list(players))
+        scores[name] = board.roll(name, players[name].pop(0))
+        if not players[name]:
+            del players[name]
+        assert [s for (s,_) in board.leaders()] == sorted(scores.values(), reverse=True)[:5]
+    assert board.hopeless == set() and sorted(board.games) == sorted(board.top)
+    print 'leaderboard tests pass'
+
+def test_random_games():
+    games = list(random_games(2000, seed=1))
+    assert games == list(random_games(2000, seed=1)) and games != list(random_games(2000, seed=2))
+    for balls in games:
+        game = BowlingGame()
+        for pins in balls:
+            game.roll(pins) # raises ValueError on an illegal ball
+        assert game.over() and game.score == bowling(balls)
+    assert all(11 <= len(balls) <= MAX_BALLS for balls in games)
+    assert sum(balls[0] == 10 for balls in games) in range(130, 240) # a first ball strike 1 time in 11
+    mean = sum(p * score for (score, p) in score_distribution(uniform_model).items())
+    assert abs(sum(map(bowling, games)) / 2000.0 - mean) < 1.5
+    blocks = list(random_packed_games(2000, seed=1, block_games=700))
+    assert [len(lengths) for (_, lengths) in blocks] == [700, 700, 600]
+    assert all(len(balls) == sum(lengths) for (balls, lengths) in blocks)
+    print 'random game tests pass'
+
+def test_scorecards():
+    games = [balls for (_,balls) in TEST_GAMES]
+    cards = scorecards(games)
+    assert list(cards.totals) == list(bowling_batch(games))
+    for (n, balls) in enumerate(games):
+        frames = slice(n * FRAMES, (n+1) * FRAMES)
+        running, index = 0, 0
+        for (frame, total) in enumerate(cards.cumulative[frames]):
+            assert cards.offsets[n * FRAMES + frame] == index
+            frame_score, increment = score_frame(index, balls)
+            running += frame_score
+            index += increment
+            assert total == running
+    assert list(cards.strikes[:FRAMES]) == [0] * 10 and list(cards.spares[3*FRAMES:4*FRAMES]) == [1] * 10
+    assert list(cards.strikes[4*FRAMES:5*FRAMES]) == [1] * 10 and list(cards.offsets[4*FRAMES:5*FRAMES]) == range(10)
+    assert list(cards.cumulative[8*FRAMES:9*FRAMES]) == [10, 30, 56, 74, 82, 100, 120, 139, 148, 168]
+    print 'scorecard tests pass'
+
 if __name__ == '__main__':
     test_bowling()
+    test_bowling_batch()
+    test_bowling_game()
+    test_score_distribution()
+    test_count_games()
+    test_leaderboard()
+    test_random_games()
+    test_scorecards()
@@ -0,0 +1,113 @@
+"""
+Multi-lane ingestion:
+---------------------
+
+A bowling center has many lanes, each sending a stream of ball events. The
+LaneHub takes events from every lane concurrently, keeps a BowlingGame per
+lane and pushes a ScoreUpdate to every subscriber after each ball.
+
+    hub = LaneHub()
+    updates = hub.subscribe(maxsize=100)
+    hub.start()
+    hub.publish(lane=7, pins=10)
+    updates.get() # ScoreUpdate(lane=7, pins=10, score=10, frame=2, over=False, error=None)
+
+Every queue is bounded. When the hub falls behind, publish() blocks the lane
+that is sending; when a subscriber falls behind, the hub blocks until it has
+room, which in turn slows the lanes down. Nothing grows without limit.
+"""
+import Queue
+import threading
+from collections import namedtuple
+
+from bowling import BowlingGame
+
+ScoreUpdate = namedtuple('ScoreUpdate', 'lane pins score frame over error')
+
+class LaneHub(object):
+    "Per-lane game state behind a bounded event queue, with bounded subscriber queues."
+
+    def __init__(self, maxsize=1000):
+        self.events = Queue.Queue(maxsize)
+        self.games = {} # lane -> BowlingGame, only touched by the hub thread
+        self.subscribers = []
+        self.thread = None
+
+    def subscribe(self, maxsize=100):
+        "A queue of ScoreUpdates for every ball; None marks the end of the stream."
+        queue = Queue.Queue(maxsize)
+        self.subscribers.append(queue)
+        return queue
+
+    def publish(self, lane, pins):
+        "Send one ball from a lane. Blocks while the hub's event queue is full."
+        self.events.put((lane, pins))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='lane-hub')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        "Process every event published so far, then end the subscriber streams."
+        self.events.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                break
+            lane, pins = event
+            game = self.games.get(lane)
+            if game is None or game.over(): # a new game starts on the lane
+                game = self.games[lane] = BowlingGame()
+            try:
+                game.roll(pins)
+                update = ScoreUpdate(lane, pins, game.score, game.frame, game.over(), None)
+            except ValueError as e: # the ball is dropped, the game carries on
+                update = ScoreUpdate(lane, pins, game.score, game.frame, game.over(), str(e))
+            for queue in self.subscribers:
+                queue.put(update) # blocks while a subscriber is behind
+        for queue in self.subscribers:
+            queue.put(None)
+
+def feed_lane(hub, lane, games):
+    "Stand-in for a lane's feed: publish every ball of every game."
+    for balls in games:
+        for pins in balls:
+            hub.publish(lane, pins)
+
+def test_lanes():
+    import time
+    from bowling import bowling, random_games
+    lanes = dict((lane, list(random_games(3, seed=lane))) for lane in range(40))
+    hub = LaneHub(maxsize=8)
+    fast, slow = hub.subscribe(maxsize=1000), hub.subscribe(maxsize=2)
+    received = {'fast': [], 'slow': []}
+    def consume(name, queue, delay):
+        for update in iter(queue.get, None):
+            received[name].append(update)
+            time.sleep(delay)
+    consumers = [threading.Thread(target=consume, args=('fast', fast, 0)),
+                 threading.Thread(target=consume, args=('slow', slow, 0.0001))]
+    feeds = [threading.Thread(target=feed_lane, args=(hub, lane, games)) for (lane, games) in lanes.items()]
+    hub.start()
+    for thread in consumers + feeds:
+        thread.start()
+    for thread in feeds:
+        thread.join()
+    hub.publish(0, 11) # not a legal ball: reported, not scored
+    hub.stop()
+    for thread in consumers:
+        thread.join()
+    assert received['fast'] == received['slow']
+    assert received['fast'][-1].error and received['fast'][-1].score == 0
+    for (lane, games) in lanes.items():
+        finals = [u.score for u in received['fast'] if u.lane == lane and u.over and not u.error]
+        assert finals == map(bowling, games)
+    assert len(received['fast']) == sum(len(balls) for games in lanes.values() for balls in games) + 1
+    print 'lane tests pass'
+
+if __name__ == '__main__':
+    test_lanes()
@@ -0,0 +1,184 @@
+"""
+Packed bowling games:
+---------------------
+
+A compact on-disk format for large numbers of games. A file holds
+
+    header   magic 'BWL2', number of games, number of balls ('<4sQQ')
+    balls    one byte per ball, every game back to back
+    lengths  one byte per game: how many balls the game used
+    offsets  games + 1 little-endian uint32s: where each game starts in balls,
+             then the number of balls
+
+so a typical game takes about 23 bytes. The reader memory-maps the file and
+copies one block of games at a time from the map straight into array('B')
+buffers, which bowling.score_balls() scores in place. No Python list is built
+per game, and memory use depends on the block size, not the file size.
+PackedGames uses the offsets to fetch any one game without a scan.
+"""
+import itertools
+import mmap
+import struct
+import sys
+from array import array
+
+from bowling import random_games, random_packed_games, score_balls
+
+MAGIC = 'BWL2'
+HEADER = struct.Struct('<4sQQ')
+SPAN = struct.Struct('<II') # offsets of a game and of the next one
+BLOCK_GAMES = 1 << 16 # games copied out of the map at a time
+
+def write_blocks(path, blocks):
+    "Write an iterable of (balls, lengths) arrays (see pack_games) to path. Returns the number of games written."
+    lengths = array('B')
+    offsets = array('I', [0])
+    nballs = 0
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+        for balls, block_lengths in blocks:
+            balls.tofile(f)
+            lengths.extend(block_lengths)
+            for length in block_lengths:
+                nballs += length
+                offsets.append(nballs) # OverflowError past 2**32 balls
+        lengths.tofile(f)
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        offsets.tofile(f)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(lengths), nballs))
+    return len(lengths)
+
+def write_games(path, games, block_games=BLOCK_GAMES):
+    "Pack an iterable of ball lists into path, block_games at a time. Returns the number of games written."
+    games = iter(games)
+    def blocks():
+        while True:
+            balls, lengths = pack_games(itertools.islice(games, block_games))
+            if not lengths:
+                return
+            yield balls, lengths
+    return write_blocks(path, blocks())
+
+def pack_games(games):
+    "Pack an iterable of ball lists in memory as (balls, lengths) arrays, laid out as in a packed file."
+    balls, lengths = array('B'), array('B')
+    for game in games:
+        balls.extend(game)
+        lengths.append(len(game))
+    return balls, lengths
+
+def write_random_games(path, n, seed=None):
+    "Write n random legal games (see bowling.random_games) to a packed file, sampled straight into arrays."
+    return write_blocks(path, random_packed_games(n, seed))
+
+def _open(path):
+    "Memory-map a packed file; returns (map, number of games, number of balls)."
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, ngames, nballs = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC:
+        mm.close()
+        raise ValueError('%s is not a packed bowling file' % path)
+    return mm, ngames, nballs
+
+def _blocks(path, block_games):
+    "Yield (balls, lengths) arrays for consecutive blocks of games in a packed file."
+    mm, ngames, nballs = _open(path)
+    try:
+        ball_pos, length_pos = HEADER.size, HEADER.size + nballs
+        for first in xrange(0, ngames, block_games):
+            lengths = array('B')
+            lengths.fromstring(buffer(mm, length_pos + first, min(block_games, ngames - first)))
+            balls = array('B')
+            balls.fromstring(buffer(mm, ball_pos, sum(lengths)))
+            ball_pos += len(balls)
+            yield balls, lengths
+    finally:
+        mm.close()
+
+def iter_scores(path, block_games=BLOCK_GAMES):
+    "Lazily yield the score of every game in a packed file, in order."
+    for balls, lengths in _blocks(path, block_games):
+        start = 0
+        for length in lengths:
+            yield score_balls(balls, start, start + length)
+            start += length
+
+def score_file(path, block_games=BLOCK_GAMES):
+    "Scores of every game in a packed file, as an array('H')."
+    return array('H', iter_scores(path, block_games))
+
+def read_games(path):
+    "Unpack every game in a packed file as a list of balls (for inspection, not for volume)."
+    for balls, lengths in _blocks(path, BLOCK_GAMES):
+        start = 0
+        for length in lengths:
+            yield balls[start:start+length].tolist()
+            start += length
+
+class PackedGames(object):
+    "Random access to the games of a packed file: game i is found through its offsets, without a scan."
+
+    def __init__(self, path):
+        self.map, self.ngames, nballs = _open(path)
+        self.offset_pos = HEADER.size + nballs + self.ngames
+
+    def __len__(self):
+        return self.ngames
+
+    def balls(self, i):
+        "The balls of game i as an array('B')."
+        if not 0 <= i < self.ngames:
+            raise IndexError('no game %d in a file of %d' % (i, self.ngames))
+        start, end = SPAN.unpack_from(self.map, self.offset_pos + 4 * i)
+        balls = array('B')
+        balls.fromstring(buffer(self.map, HEADER.size + start, end - start))
+        return balls
+
+    def __getitem__(self, i):
+        return self.balls(i).tolist()
+
+    def score(self, i):
+        return score_balls(self.balls(i))
+
+    def close(self):
+        self.map.close()
+
+def test_packed():
+    import os
+    import tempfile
+    from bowling import TEST_GAMES
+    fd, path = tempfile.mkstemp(suffix='.bwl')
+    os.close(fd)
+    try:
+        games = [balls for (_,balls) in TEST_GAMES] * 5
+        assert write_games(path, iter(games)) == len(games)
+        assert write_games(path + '.3', games, block_games=3) == len(games)
+        assert open(path + '.3', 'rb').read() == open(path, 'rb').read()
+        os.remove(path + '.3')
+        assert os.path.getsize(path) == HEADER.size + sum(map(len, games)) + 5 * len(games) + 4
+        assert list(read_games(path)) == games
+        assert list(score_file(path)) == [score for (score,_) in TEST_GAMES] * 5
+        assert list(iter_scores(path, block_games=3)) == list(score_file(path))
+        balls, lengths = pack_games(games)
+        assert balls.tolist() == sum(games, []) and lengths.tolist() == map(len, games)
+        assert write_random_games(path, 500, seed=3) == 500
+        assert list(read_games(path)) == list(random_games(500, seed=3))
+        packed = PackedGames(path)
+        assert len(packed) == 500 and [packed[i] for i in (499, 0, 250)] == [list(read_games(path))[i] for i in (499, 0, 250)]
+        assert [packed.score(i) for i in range(500)] == list(score_file(path))
+        try:
+            packed[500]
+            assert False
+        except IndexError:
+            pass
+        packed.close()
+        assert write_games(path, []) == 0 and list(score_file(path)) == []
+    finally:
+        os.remove(path)
+    print 'packed tests pass'
+
+if __name__ == '__main__':
+    test_packed()
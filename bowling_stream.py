@@ -0,0 +1,98 @@
+"""
+Streaming bowling scorer:
+-------------------------
+
+Score an archive of games that is too big to hold in memory. Each line of
+the input holds one game as a comma separated list of rolls:
+
+    10,10,10,10,10,10,10,10,10,10,10,10
+    9,1,0,10,10,10,6,2,7,3,8,2,10,9,0,9,1,10
+
+and each line of the output holds the score of the game on the same line:
+
+    $ python bowling_stream.py games.txt -o scores.txt -j 8
+    $ python bowling_stream.py --test
+
+Lines are read lazily, grouped into chunks and fanned out to a process pool.
+Only a fixed window of chunks is ever in flight, and results are written in
+input order, so memory stays bounded whatever the size of the input.
+"""
+import argparse
+import itertools
+import multiprocessing
+import sys
+from collections import deque
+
+from bowling import bowling_batch
+
+CHUNK_SIZE = 10000 # games per task sent to a worker
+
+def parse_game(line):
+    return [int(ball) for ball in line.split(',')]
+
+def score_lines(lines):
+    "Worker task: parse and score a chunk of game lines."
+    return bowling_batch(parse_game(line) for line in lines)
+
+def chunked(lines, size=CHUNK_SIZE):
+    "Group the non blank lines into lists of at most size lines."
+    lines = (line for line in lines if line.strip())
+    while True:
+        chunk = list(itertools.islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+def score_stream(lines, processes=None, chunk_size=CHUNK_SIZE):
+    "Yield the score of every game in lines, in order, scoring chunks in a process pool."
+    pool = multiprocessing.Pool(processes)
+    window = 2 * (processes or multiprocessing.cpu_count()) # chunks in flight at once
+    in_flight = deque()
+    try:
+        for chunk in chunked(lines, chunk_size):
+            in_flight.append(pool.apply_async(score_lines, (chunk,)))
+            if len(in_flight) >= window:
+                for score in in_flight.popleft().get():
+                    yield score
+        while in_flight:
+            for score in in_flight.popleft().get():
+                yield score
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a file of bowling games, one game per line.')
+    parser.add_argument('input', nargs='?', help="file of comma separated rolls, or '-' for stdin")
+    parser.add_argument('-o', '--output', help='where to write the scores (default: stdout)')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='games per worker task')
+    parser.add_argument('--test', action='store_true', help='run the tests instead')
+    args = parser.parse_args(argv)
+    if args.test:
+        return test_stream()
+    if args.input is None:
+        parser.error('an input file is required')
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    outfile = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for score in score_stream(infile, args.processes, args.chunk_size):
+            outfile.write('%d\n' % score)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+def test_stream():
+    from bowling import TEST_GAMES
+    lines = [','.join(map(str, balls)) + '\n' for (_,balls) in TEST_GAMES] * 7 + ['\n']
+    expected = [score for (score,_) in TEST_GAMES] * 7
+    assert list(score_stream(iter(lines), processes=2, chunk_size=5)) == expected
+    assert list(score_stream(iter([]), processes=1)) == []
+    assert [len(chunk) for chunk in chunked(lines, 40)] == [40, 40, 11]
+    print 'stream tests pass'
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Logic puzzle benchmarks
+-----------------------
+
+Generate seeded random puzzles in the style of logic_puzzle.py and time every
+solving backend on them:
+
+    $ python logic_bench.py --sizes 5 6 7 8 --attributes 4 --seeds 3 > bench.json
+    $ python logic_bench.py --test
+
+A puzzle with n entities and m attributes has m groups of n names
+('g0_0' ... 'g0_<n-1>', 'g1_0', ...) and n positions ('p0' ...). The clues
+are the kinds used in logic_puzzle.py: same, different, after, either and
+one_of_two. They are drawn at random from the ones true of a hidden solution
+until that solution is the only one, and then clues that are not needed are
+dropped, so every generated puzzle has exactly one solution. A uniqueness
+check that takes the CSP search more than BUDGET branches counts as a "no",
+so generation cannot stall on one hard set of clues.
+
+Generating a puzzle and each run of a backend go in their own forked
+process, with a timeout. The JSON output records, for each puzzle and
+backend, the generation time, the candidates tried (see
+logic_puzzle.solutions), the wall time and the peak memory growth of the run,
+or the error of a backend that cannot take a puzzle that big.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+
+from logic_csp import Session
+from logic_puzzle import BACKENDS, Puzzle, solutions
+
+BUDGET = 5000 # branches a uniqueness check may take while generating; past that, more clues are added
+
+def blank_puzzle(n, m):
+    "A puzzle with n positions 'p0'... and m groups of n names 'g0_0'..., and no clues."
+    puzzle = Puzzle(['p%d' % p for p in range(n)])
+    for g in range(m):
+        puzzle.group(*['g%d_%d' % (g, i) for i in range(n)])
+    return puzzle
+
+def random_puzzle(n, m, seed=None):
+    """A random puzzle with n entities and m attributes and exactly one solution. Returns (puzzle, solution).
+    A uniqueness check that runs past BUDGET branches counts as not unique, so generation always ends."""
+    rng = random.Random(seed)
+    puzzle = blank_puzzle(n, m)
+    answer = {}
+    for group in puzzle.groups:
+        answer.update(zip(group, rng.sample(range(n), n)))
+    answer.update((name, p) for (p, name) in enumerate(puzzle.positions))
+    session = Session(puzzle)
+    while not session.is_unique(BUDGET):
+        for _ in range(n):
+            random_clue(puzzle, answer, rng)
+            session.add(puzzle.clauses[-1])
+    for clause in rng.sample(puzzle.clauses, len(puzzle.clauses)): # drop the clues that are not needed
+        session.remove(clause)
+        if not session.is_unique(BUDGET):
+            session.add(clause)
+    puzzle.clauses = session.clauses()
+    return puzzle, session.solution()
+
+def clue_specs(puzzle):
+    "The clues of a generated puzzle as picklable (kind, names, params) triples; see puzzle_from_specs()."
+    return [(clause.kind, clause.names, clause.params) for clause in puzzle.clauses]
+
+def puzzle_from_specs(n, m, specs):
+    "The generated puzzle with n entities, m attributes and the clues clue_specs() gave."
+    puzzle = blank_puzzle(n, m)
+    for (kind, names, params) in specs:
+        if kind in ('either', 'one_of_two'):
+            getattr(puzzle, kind)(names[:2], names[2:])
+        else:
+            getattr(puzzle, kind)(*(names + params))
+    return puzzle
+
+def random_clue(puzzle, answer, rng):
+    """Add to puzzle a random clue that is true of the answer. An alternative of either() or one_of_two()
+    never pairs two names of one group: it could not hold, and the clue would be a same() in disguise."""
+    names = puzzle.variables()
+    group_of = dict((name, g) for (g, group) in enumerate(puzzle.groups) for name in group)
+    def apart(a, b): # two names of one group, never at the same position
+        return a != b and a in group_of and group_of.get(b) == group_of[a]
+    def pick(p=None): # a name (or now and then a position) at position p, or anywhere
+        choices = [name for name in names if p is None or answer[name] == p]
+        if p is not None and rng.random() < 0.2:
+            return puzzle.positions[p]
+        return rng.choice(choices)
+    a = pick()
+    kind = rng.choice(['same', 'different', 'after', 'either', 'one_of_two'])
+    if kind == 'same':
+        b = pick(answer[a])
+        if b != a:
+            return puzzle.same(a, b)
+    elif kind == 'after' and answer[a] > 0:
+        return puzzle.after(a, pick(answer[a] - 1))
+    elif kind == 'either':
+        b = pick(answer[a])
+        c, d = pick(), pick()
+        if b != a and c != d and not apart(c, d):
+            return puzzle.either(*rng.sample([(a, b), (c, d)], 2))
+    elif kind == 'one_of_two':
+        x, y = pick(), pick()
+        p, q = pick(answer[x]), pick(answer[y])
+        if answer[x] != answer[y] and x != p and y != q and not apart(x, q) and not apart(y, p):
+            return puzzle.one_of_two((x, y), (p, q))
+    b = pick()
+    while answer[b] == answer[a]:
+        b = pick()
+    puzzle.different(a, b)
+
+def _measure(puzzle, backend):
+    "Check the puzzle's solution is unique with backend, and return the measurements."
+    stats = {'candidates': 0} # a puzzle solved by propagation alone tries none
+    start_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    found = len(list(itertools.islice(solutions(puzzle, backend, stats), 2)))
+    seconds = time.time() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_kb
+    return dict(stats, seconds=seconds, peak_memory_kb=peak_kb, solutions=found)
+
+def _generate(n, m, seed):
+    "Generate a random puzzle, and return its clue specs (the clues themselves do not pickle) and answer."
+    start = time.time()
+    puzzle, answer = random_puzzle(n, m, seed)
+    return dict(specs=clue_specs(puzzle), answer=answer, seconds=time.time() - start)
+
+def _run(target, args, conn):
+    "Child process: send back target(*args), a dict."
+    try:
+        result = target(*args)
+    except Exception as e: # a puzzle too big for the backend, or a bug: report it rather than die
+        result = {'error': '%s: %s' % (type(e).__name__, e)}
+    conn.send(result)
+    conn.close()
+
+def run_limited(target, args, timeout):
+    """target(*args) in a forked process; {'timeout': True} if it runs too long, and {'error': ...}
+    if it fails or the process dies without reporting."""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run, args=(target, args, sender))
+    process.start()
+    sender.close() # the child holds the only sending end, so its death shows up as EOF
+    try:
+        if receiver.poll(timeout):
+            result = receiver.recv()
+        else:
+            result = {'timeout': True, 'seconds': timeout}
+    except EOFError:
+        result = None
+    process.terminate()
+    process.join()
+    if result is None:
+        result = {'error': 'process exited with code %s' % process.exitcode}
+    return result
+
+def time_backend(puzzle, backend, timeout):
+    "Measurements for one backend on one puzzle, under run_limited()."
+    return run_limited(_measure, (puzzle, backend), timeout)
+
+def benchmark(sizes, attributes, seeds, backends=BACKENDS, timeout=60.0):
+    """List of result records for every size, seed and backend. Generating a puzzle is limited to timeout
+    too; if it times out or fails, the records say so in their generate_ fields and no backend is run."""
+    results = []
+    for n in sizes:
+        for seed in range(seeds):
+            generated = run_limited(_generate, (n, attributes, seed), timeout)
+            puzzle = 'specs' in generated and puzzle_from_specs(n, attributes, generated['specs'])
+            for backend in backends:
+                record = dict(entities=n, attributes=attributes, seed=seed, backend=backend)
+                record.update(('generate_' + key, value) for (key, value) in generated.items()
+                              if key in ('seconds', 'timeout', 'error'))
+                if puzzle:
+                    record['clues'] = len(puzzle.clauses)
+                    record.update(time_backend(puzzle, backend, timeout))
+                results.append(record)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time every logic puzzle backend on random puzzles.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=range(5, 13), help='entities per puzzle (default 5..12)')
+    parser.add_argument('--attributes', type=int, default=4, help='attribute groups per puzzle')
+    parser.add_argument('--seeds', type=int, default=3, help='puzzles per size')
+    parser.add_argument('--backends', nargs='+', default=BACKENDS, choices=BACKENDS)
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds allowed per run')
+    parser.add_argument('--test', action='store_true', help='run the tests instead')
+    args = parser.parse_args(argv)
+    if args.test:
+        return test_bench()
+    results = benchmark(args.sizes, args.attributes, args.seeds, args.backends, args.timeout)
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+def test_bench():
+    import os
+    from logic_csp import count_solutions
+    for (n, m) in [(5, 3), (7, 4), (9, 5)]:
+        puzzle, answer = random_puzzle(n, m, seed=n)
+        assert count_solutions(puzzle) == 1 and list(solutions(puzzle)) == [answer]
+        assert all(puzzle.without(i).clauses and count_solutions(puzzle.without(i)) > 1 for i in range(len(puzzle.clauses)))
+    assert [c.label for c in random_puzzle(6, 3, seed=1)[0].clauses] == [c.label for c in random_puzzle(6, 3, seed=1)[0].clauses]
+    results = benchmark([5], 3, 1, timeout=30)
+    assert [r['backend'] for r in results] == BACKENDS
+    assert all(r['solutions'] == 1 and r['candidates'] >= 0 and r['seconds'] >= 0 for r in results)
+    assert results[0]['candidates'] > 0 # search tries assignments even when propagation would do
+    assert json.loads(json.dumps(results)) == results
+    puzzle, answer = random_puzzle(10, 4, seed=0) # big enough that uniqueness checks need the budget
+    assert count_solutions(puzzle) == 1 and list(solutions(puzzle, 'sat')) == [answer]
+    grouped = lambda a, b: any(a in group and b in group for group in puzzle.groups)
+    assert not any(grouped(*pair) for c in puzzle.clauses if c.kind == 'either' for pair in (c.names[:2], c.names[2:]))
+    assert not any(grouped(*pair) for c in puzzle.clauses if c.kind == 'one_of_two' for pair in (c.names[::3], c.names[1:3]))
+    assert puzzle_from_specs(10, 4, clue_specs(puzzle)).clauses[-1].label == puzzle.clauses[-1].label
+    results = benchmark([10], 4, 1, ['csp', 'sat'], timeout=60)
+    assert all(r['solutions'] == 1 and r['clues'] == len(puzzle.clauses) for r in results)
+    assert benchmark([12], 5, 1, ['csp'], timeout=0.01) == [dict(entities=12, attributes=5, seed=0, backend='csp',
+                                                                generate_timeout=True, generate_seconds=0.01)]
+    big = random_puzzle(10, 5, seed=10)[0]
+    assert time_backend(big, 'search', 0.5) == {'timeout': True, 'seconds': 0.5}
+    assert 'placements' in time_backend(big, 'tables', 30)['error']
+    assert time_backend(big, 'oracle', 30)['error'].startswith('ValueError') # unknown backend
+    crash = Puzzle(['p0', 'p1'])
+    crash.group('a', 'b')
+    crash.clause(lambda a: 1 / 0)
+    assert time_backend(crash, 'search', 30)['error'].startswith('ZeroDivisionError')
+    crash.clause(lambda a, b: os._exit(3))
+    start = time.time()
+    assert time_backend(crash.without(0), 'search', 30) == {'error': 'process exited with code 3'}
+    assert time.time() - start < 10 # not the timeout
+    print 'bench tests pass'
+
+if __name__ == '__main__':
+    main()
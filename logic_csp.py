@@ -0,0 +1,492 @@
+"""
+Bitmask constraint solver for logic puzzles
+-------------------------------------------
+
+A backend for the Puzzle objects of logic_puzzle.py that scales past the
+sizes where enumerating permutations is hopeless. The set of positions a name
+can still take (its domain) is an integer bitmask: bit p is set when the name
+may be at position p. Position constants are names whose domain is a single
+bit.
+
+Constraints narrow domains with a few bit operations each, and propagation
+runs them to a fixpoint. Each group is all-different. The typed clauses are
+same, different, after, either and one_of_two. Any other predicate is checked
+by enumerating the supports of its values. The search then branches on the
+name with the smallest domain and propagates again.
+"""
+
+import itertools
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+def bits(mask):
+    "Yield the single-bit masks set in mask, lowest first."
+    while mask:
+        low = mask & -mask
+        yield low
+        mask ^= low
+
+def position(bit):
+    return bit.bit_length() - 1
+
+PRED_LIMIT = 4096 # largest product of domains a generic predicate enumerates to filter values
+
+class OutOfBudget(Exception):
+    "A search tried more branches than its budget allowed."
+
+class CSP(object):
+    "A puzzle compiled to bitmask domains and constraints."
+
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+        self.variables = puzzle.variables()
+        self.npos = len(puzzle.positions)
+        self.full = (1 << self.npos) - 1
+        names = self.variables + puzzle.positions
+        self.index = dict((name, i) for (i, name) in enumerate(names))
+        self.domains = [self.full] * len(self.variables) + [1 << p for p in range(self.npos)]
+        self.constraints = [] # (kind, vars, params, pred)
+        self.watch = None
+        self.disabled = set() # constraints switched off, see Session.remove()
+        self.group_of = [None] * len(names) # group number of each name, None for position constants
+        for (g, group) in enumerate(puzzle.groups):
+            for name in group:
+                self.group_of[self.index[name]] = g
+        for group in puzzle.groups:
+            self.constraints.append(('alldiff', [self.index[name] for name in group], (), None))
+        for clause in puzzle.clauses:
+            self.add_clause(clause)
+
+    def add_clause(self, clause):
+        "Add a constraint for clause; returns its index in self.constraints."
+        if not all(name in self.index for name in clause.names):
+            raise ValueError('clause %r mentions an unknown name' % clause.label)
+        self.constraints.append((clause.kind, [self.index[name] for name in clause.names], clause.params, clause.pred))
+        self.watch = None
+        return len(self.constraints) - 1
+
+    def apart(self, a, b):
+        "Are a and b two names of one group, so never at the same position?"
+        return a != b and self.group_of[a] is not None and self.group_of[a] == self.group_of[b]
+
+    def watchers(self):
+        "For each name, the constraints to run again when its domain changes."
+        if self.watch is None:
+            self.watch = [[] for _ in self.domains]
+            for (c, (_, vs, _, _)) in enumerate(self.constraints):
+                for v in set(vs):
+                    self.watch[v].append(c)
+        return self.watch
+
+    def propagate(self, d, changed=None):
+        """Narrow the domains d in place to a fixpoint. Only the constraints watching the changed names
+        are run at first (all of them if changed is None). Returns False if some domain becomes empty."""
+        watch = self.watchers()
+        if changed is None:
+            queue = range(len(self.constraints))
+        else:
+            queue = sorted(set(c for v in changed for c in watch[v]))
+        if self.disabled:
+            queue = [c for c in queue if c not in self.disabled]
+        queued = set(queue)
+        while queue:
+            c = queue.pop()
+            queued.discard(c)
+            kind, vs, params, pred = self.constraints[c]
+            before = [d[v] for v in vs]
+            if PROPAGATORS[kind](self, d, vs, params, pred) is False:
+                return False
+            for (v, old) in zip(vs, before):
+                if d[v] != old:
+                    if not d[v]:
+                        return False
+                    for other in watch[v]:
+                        if other not in queued and other not in self.disabled:
+                            queued.add(other)
+                            queue.append(other)
+        return True
+
+    def solutions(self, d=None, stats=None):
+        "Lazily generate every solution as a {name: position} dict; stats['candidates'] counts branches tried."
+        d = list(self.domains if d is None else d)
+        if not self.propagate(d):
+            return
+        for solution in self._extend(d, stats):
+            yield solution
+
+    def _extend(self, d, stats=None, budget=None):
+        best, size = None, self.npos + 1
+        for v in xrange(len(self.variables)):
+            n = popcount(d[v])
+            if 1 < n < size:
+                best, size = v, n
+        if best is None:
+            if self.check(d):
+                yield dict((name, position(d[v])) for (v, name) in enumerate(self.variables))
+            return
+        for bit in bits(d[best]):
+            child = d[:]
+            child[best] = bit
+            if stats is not None:
+                stats['candidates'] = stats.get('candidates', 0) + 1
+                if budget is not None and stats['candidates'] > budget:
+                    raise OutOfBudget()
+            if self.propagate(child, [best]):
+                for solution in self._extend(child, stats, budget):
+                    yield solution
+
+    def count(self, d=None):
+        """Number of solutions, without enumerating them. Names that share no constraint are counted
+        separately and multiplied, and the count of each such component is memoized on its domains."""
+        d = list(self.domains if d is None else d)
+        if not self.propagate(d):
+            return 0
+        return self._count(d, [v for v in xrange(len(self.variables)) if d[v] & (d[v] - 1)], {})
+
+    def _count(self, d, unfixed, cache):
+        total = 1
+        for component in self.components(d, unfixed):
+            total *= self._count_component(d, component, cache)
+            if not total:
+                break
+        return total
+
+    def _count_component(self, d, component, cache):
+        watch = self.watchers()
+        fixed = sorted(set(u for v in component for c in watch[v] if self.constraints[c][0] not in EXACT
+                           for u in self.constraints[c][1] if d[u] & (d[u] - 1) == 0))
+        key = (tuple((v, d[v]) for v in component), tuple((u, d[u]) for u in fixed))
+        if key not in cache:
+            best = min(component, key=lambda v: popcount(d[v]))
+            total = 0
+            for bit in bits(d[best]):
+                child = d[:]
+                child[best] = bit
+                if self.propagate(child, [best]):
+                    total += self._count(child, [v for v in component if child[v] & (child[v] - 1)], cache)
+            cache[key] = total
+        return cache[key]
+
+    def components(self, d, unfixed):
+        "Split the unfixed names into groups that no constraint connects."
+        watch = self.watchers()
+        left = set(unfixed)
+        while left:
+            component, frontier = [], [left.pop()]
+            while frontier:
+                v = frontier.pop()
+                component.append(v)
+                for c in watch[v]:
+                    for u in self.constraints[c][1]:
+                        if u in left:
+                            left.remove(u)
+                            frontier.append(u)
+            yield sorted(component)
+
+    def check(self, d):
+        "Do the fixed domains d satisfy every clause?"
+        for (c, (kind, vs, params, pred)) in enumerate(self.constraints):
+            if kind != 'alldiff' and c not in self.disabled and not pred(*[position(d[v]) for v in vs]):
+                return False
+        return True
+
+def _alldiff(csp, d, vs, params, pred):
+    changed = True
+    while changed:
+        changed = False
+        taken = 0
+        for v in vs:
+            if d[v] & (d[v] - 1) == 0: # fixed
+                if d[v] & taken:
+                    return False
+                taken |= d[v]
+        for v in vs:
+            if d[v] & taken and d[v] & (d[v] - 1):
+                d[v] &= ~taken
+                if not d[v]:
+                    return False
+                changed = True
+        union = 0
+        for v in vs:
+            union |= d[v]
+        if popcount(union) < len(vs):
+            return False
+        if len(vs) == csp.npos: # every position is used: a position only one name can take is that name's
+            for bit in bits(csp.full):
+                holders = [v for v in vs if d[v] & bit]
+                if not holders:
+                    return False
+                if len(holders) == 1 and d[holders[0]] != bit:
+                    d[holders[0]] = bit
+                    changed = True
+
+def _same(csp, d, (a, b), params, pred):
+    if csp.apart(a, b):
+        return False
+    d[a] = d[b] = d[a] & d[b]
+
+def _different(csp, d, (a, b), params, pred):
+    if d[a] & (d[a] - 1) == 0:
+        d[b] &= ~d[a]
+    if d[b] & (d[b] - 1) == 0:
+        d[a] &= ~d[b]
+
+def _after(csp, d, (a, b), (gap,), pred):
+    d[a] &= (d[b] << gap if gap >= 0 else d[b] >> -gap) & csp.full
+    d[b] &= d[a] >> gap if gap >= 0 else d[a] << -gap
+
+def _either(csp, d, (a, b, c, e), params, pred):
+    first = not csp.apart(a, b) and d[a] & d[b] # an alternative equating two names of a group never holds
+    second = not csp.apart(c, e) and d[c] & d[e]
+    if not first:
+        return _same(csp, d, (c, e), (), None)
+    elif not second:
+        return _same(csp, d, (a, b), (), None)
+
+def _one_of_two(csp, d, (x, y, p, q), params, pred):
+    straight = not csp.apart(x, p) and not csp.apart(y, q) and d[x] & d[p] and d[y] & d[q]
+    crossed = not csp.apart(x, q) and not csp.apart(y, p) and d[x] & d[q] and d[y] & d[p]
+    if not straight and not crossed:
+        return False
+    if not crossed:
+        _same(csp, d, (x, p), (), None)
+        _same(csp, d, (y, q), (), None)
+    elif not straight:
+        _same(csp, d, (x, q), (), None)
+        _same(csp, d, (y, p), (), None)
+    else:
+        d[x] &= d[p] | d[q]
+        d[y] &= d[p] | d[q]
+        d[p] &= d[x] | d[y]
+        d[q] &= d[x] | d[y]
+
+def _pred(csp, d, vs, params, pred):
+    size = 1
+    for v in vs:
+        size *= popcount(d[v])
+    if size > PRED_LIMIT:
+        return
+    supported = [0] * len(vs)
+    def assign(i, values, masks):
+        if i == len(vs):
+            if pred(*values):
+                for (j, mask) in enumerate(masks):
+                    supported[j] |= mask
+            return
+        for bit in bits(d[vs[i]]):
+            assign(i + 1, values + [position(bit)], masks + [bit])
+    assign(0, [], [])
+    for (v, mask) in zip(vs, supported):
+        d[v] &= mask
+    if not all(supported):
+        return False
+
+PROPAGATORS = {'alldiff': _alldiff, 'same': _same, 'different': _different, 'after': _after,
+               'either': _either, 'one_of_two': _one_of_two, 'pred': _pred}
+
+class Session(object):
+    """Incremental solving while a puzzle is edited one clause at a time. The propagated domains after
+    each clause are kept: adding a clause only narrows the latest domains, and removing one goes back
+    to the domains from before it and replays only the clauses added after it. Solutions found so far
+    are kept too, and are filtered rather than searched for again when a clause is added."""
+
+    def __init__(self, puzzle):
+        base = puzzle.without(0)
+        base.clauses = []
+        self.csp = CSP(base)
+        self.edits = [] # (clause, constraint index), in the order they were added
+        self.states = [list(self.csp.domains)] # propagated domains after each edit, None if contradictory
+        if not self.csp.propagate(self.states[0]):
+            self.states[0] = None
+        self.found, self.exhaustive = [], False # solutions known, and whether they are all of them
+        for clause in puzzle.clauses:
+            self.add(clause)
+
+    def clauses(self):
+        return [clause for (clause, _) in self.edits]
+
+    def add(self, clause):
+        c = self.csp.add_clause(clause)
+        self.edits.append((clause, c))
+        self.states.append(self._narrow(self.states[-1], c))
+        found = [s for s in self.found if clause.pred(*[self._value(s, name) for name in clause.names])]
+        if self.exhaustive or len(found) >= 2:
+            self.found = found
+        else:
+            self.found, self.exhaustive = [], False
+
+    def remove(self, label):
+        "Remove the clause with this label (or this clause)."
+        i = next(i for (i, (clause, _)) in enumerate(self.edits) if label in (clause, clause.label))
+        self.csp.disabled.add(self.edits.pop(i)[1])
+        del self.states[i+1:]
+        later = [c for (_, c) in self.edits[i:]]
+        self.csp.disabled.update(later) # each state may only use the clauses added before it
+        for c in later:
+            self.csp.disabled.discard(c)
+            self.states.append(self._narrow(self.states[-1], c))
+        self.exhaustive = False # every solution found is still one, but there may be more
+
+    def _narrow(self, d, c):
+        if d is None:
+            return None
+        d = list(d)
+        return d if self.csp.propagate(d, self.csp.constraints[c][1]) else None
+
+    def _value(self, solution, name):
+        return solution[name] if name in solution else self.csp.puzzle.positions.index(name)
+
+    def domains(self):
+        "The current propagated domains, as {name: list of positions}; None if the clauses contradict."
+        d = self.states[-1]
+        if d is None:
+            return None
+        return dict((name, map(position, bits(d[v]))) for (v, name) in enumerate(self.csp.variables))
+
+    def solutions(self):
+        "Lazily generate every solution of the current clauses."
+        if self.states[-1] is None:
+            return iter([])
+        return self.csp._extend(list(self.states[-1]))
+
+    def is_unique(self, budget=None):
+        "Do the current clauses have one solution? None if telling takes the search more than budget branches."
+        if not self.exhaustive and len(self.found) < 2:
+            try:
+                found = []
+                if self.states[-1] is not None:
+                    found = list(itertools.islice(self.csp._extend(list(self.states[-1]), {}, budget), 2))
+            except OutOfBudget:
+                return None
+            self.found, self.exhaustive = found, len(found) < 2
+        return len(self.found) == 1
+
+    def solution(self):
+        "A solution of the current clauses, or None."
+        if not self.found and not self.exhaustive:
+            self.is_unique()
+        return self.found[0] if self.found else None
+
+# Constraints whose fixed names need not be part of a memo key: propagation has already removed every
+# value of the unfixed names that is inconsistent with them.
+EXACT = set(['alldiff', 'same', 'different', 'after'])
+
+def csp_solutions(puzzle, stats=None):
+    "Lazily generate every solution of puzzle as a {name: position} dict."
+    return CSP(puzzle).solutions(stats=stats)
+
+def csp_solve(puzzle):
+    "The first solution of puzzle, or None."
+    return next(csp_solutions(puzzle), None)
+
+def count_solutions(puzzle):
+    "The number of solutions of puzzle, found by counting rather than enumerating."
+    return CSP(puzzle).count()
+
+def clue_contributions(puzzle):
+    "List of (label, number of solutions without that clause) for each clause of puzzle."
+    return [(clause.label, count_solutions(puzzle.without(i))) for (i, clause) in enumerate(puzzle.clauses)]
+
+def chain_puzzle(n):
+    "A puzzle with n positions and one solution: a_i at position i, b_i at i except b_0 and b_n-1 swapped."
+    from logic_puzzle import Puzzle
+    puzzle = Puzzle(['p%d' % i for i in range(n)])
+    puzzle.group(*['a%d' % i for i in range(n)])
+    puzzle.group(*['b%d' % i for i in range(n)])
+    for i in range(1, n):
+        puzzle.after('a%d' % i, 'a%d' % (i - 1))
+        puzzle.either(('b%d' % i, 'a%d' % i), ('b%d' % i, 'p0'))
+    puzzle.same('b0', 'a%d' % (n - 1))
+    return puzzle
+
+def test_csp():
+    from logic_puzzle import arrivals_puzzle, arrival_order, logic_puzzle, search, small_puzzle
+    puzzle = arrivals_puzzle()
+    assert arrival_order(csp_solve(puzzle)) == logic_puzzle()
+    assert list(csp_solutions(puzzle)) == list(search(puzzle))
+    big = chain_puzzle(10)
+    expected = dict([('a%d' % i, i) for i in range(10)] + [('b%d' % i, i) for i in range(1, 9)], b0=9, b9=0)
+    assert list(csp_solutions(big)) == [expected]
+    small = small_puzzle()
+    small.same('x', 'c')
+    assert sorted(csp_solutions(small)) == sorted(search(small))
+    small.one_of_two(('a', 'y'), ('first', 'third'))
+    small.after('a', 'c', -1)
+    assert list(csp_solutions(small)) == list(search(small)) == [dict(a=0, b=2, c=1, x=1, y=2)]
+    small.after('a', 'y', -1)
+    assert list(csp_solutions(small)) == list(search(small)) == []
+    grouped = small_puzzle().without(0) # no a < b
+    grouped.either(('a', 'b'), ('x', 'first')) # a and b are never together, so x is first
+    grouped.one_of_two(('y', 'c'), ('a', 'third')) # crossed would put c with a, so c is third
+    csp = CSP(grouped)
+    d = list(csp.domains)
+    assert csp.propagate(d) and d[csp.index['x']] == 1 << 0 and d[csp.index['c']] == 1 << 2
+    assert sorted(csp_solutions(grouped)) == sorted(search(grouped))
+    from logic_bench import random_puzzle
+    for seed in range(3): # generated 10-entity puzzles take a few dozen branches, not a blind search
+        puzzle, answer = random_puzzle(10, 4, seed)
+        stats = {}
+        assert list(csp_solutions(puzzle, stats)) == [answer] and stats['candidates'] < 1000
+    print 'csp tests pass'
+
+def test_count():
+    from logic_puzzle import arrivals_puzzle, search, small_puzzle
+    puzzle = arrivals_puzzle()
+    assert count_solutions(puzzle) == 1
+    assert [n for (_, n) in clue_contributions(puzzle)] == [len(list(search(puzzle.without(i)))) for i in range(len(puzzle.clauses))]
+    puzzle.clauses = []
+    assert count_solutions(puzzle) == 120 ** 3
+    free = chain_puzzle(6)
+    free.clauses = free.clauses[::3]
+    assert count_solutions(free) == len(list(search(free))) == 1152
+    free = chain_puzzle(8)
+    free.clauses = []
+    assert count_solutions(free) == 40320 ** 2
+    small = small_puzzle()
+    assert count_solutions(small) == 3 * 6
+    small.different('a', 'first')
+    small.different('a', 'second')
+    assert count_solutions(small) == 0
+    print 'count tests pass'
+
+def test_session():
+    from logic_puzzle import arrivals_puzzle, arrival_order, logic_puzzle, search
+    puzzle = arrivals_puzzle()
+    session = Session(puzzle)
+    assert session.is_unique() and arrival_order(session.solution()) == logic_puzzle()
+    clue = puzzle.clauses[-1]
+    session.remove(clue.label)
+    assert not session.is_unique() and len(list(session.solutions())) == 2
+    assert Session(puzzle.without(len(puzzle.clauses) - 1)).is_unique(budget=0) is None # must branch to tell
+    assert session.clauses() == puzzle.clauses[:-1]
+    session.add(clue)
+    assert session.is_unique() and session.exhaustive
+    puzzle.different('knuth', 'monday')
+    session.add(puzzle.clauses[-1])
+    assert session.exhaustive and len(session.found) == 1 # still unique, known without searching
+    session.remove(puzzle.clauses.pop())
+    for clause in puzzle.clauses[:6]:
+        session.remove(clause)
+        assert sorted(session.solutions()) == sorted(search(puzzle.without(puzzle.clauses.index(clause))))
+        session.add(clause)
+        assert session.is_unique()
+    assert session.domains()['knuth'] == [2]
+    puzzle.different('knuth', 'wednesday')
+    session.add(puzzle.clauses[-1])
+    assert session.domains() is None and session.solution() is None and not session.is_unique()
+    session.remove(puzzle.clauses[-1].label)
+    assert arrival_order(session.solution()) == logic_puzzle()
+    clauses = session.clauses()
+    session.remove(clauses[0]) # replays every later clause
+    rest = puzzle.without(0)
+    for clause in clauses[:-5:-1]:
+        session.remove(clause)
+        rest.clauses = session.clauses()
+        assert sorted(session.solutions()) == sorted(csp_solutions(rest))
+    print 'session tests pass'
+
+if __name__ == '__main__':
+    test_csp()
+    test_count()
+    test_session()
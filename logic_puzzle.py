@@ -30,13 +30,20 @@ then you would return:
 (You can assume that the days mentioned are all in the same week.)
 """
 import itertools
+import multiprocessing
+from collections import namedtuple
 
 PERSONS = ['Wilkes','Hamming','Knuth','Minsky','Simon']
+DAYS = ['monday','tuesday','wednesday','thursday','friday']
 
 def logic_puzzle():
-    wilkes,hamming,knuth,minsky,simon = PERSONS
     ordering = list(itertools.permutations(PERSONS))
-    return next([mon,tue,wed,thu,fri] for (mon,tue,wed,thu,fri) in ordering
+    return next(arrivals(ordering, ordering))
+
+def arrivals(day_orderings, ordering):
+    "Generate the arrival orders, taken from day_orderings, that satisfy every clue."
+    wilkes,hamming,knuth,minsky,simon = PERSONS
+    return ([mon,tue,wed,thu,fri] for (mon,tue,wed,thu,fri) in day_orderings
            for (laptop,droid,tablet,iphone,_) in ordering
             for (programmer,writer,manager,designer,_) in ordering
                         if(wed == laptop and programmer != wilkes and \
@@ -49,10 +56,350 @@ def logic_puzzle():
                         ((iphone == tue) or (tablet == tue)))
                 )
 
+def first_arrival(day_orderings):
+    "Worker for logic_puzzle_parallel: the first answer within one shard of day orderings, or None."
+    return next(arrivals(day_orderings, list(itertools.permutations(PERSONS))), None)
+
+def logic_puzzle_parallel(processes=None, shards=None):
+    """logic_puzzle() with the day orderings split into shards that a process pool searches at once.
+    Shards report in order, and the pool is torn down, cancelling the rest, at the first answer."""
+    ordering = list(itertools.permutations(PERSONS))
+    shards = shards or 4 * (processes or multiprocessing.cpu_count())
+    size = -(-len(ordering) // shards)
+    pool = multiprocessing.Pool(processes)
+    try:
+        for answer in pool.imap(first_arrival, [ordering[i:i+size] for i in range(0, len(ordering), size)]):
+            if answer is not None:
+                return answer
+    finally:
+        pool.terminate()
+        pool.join()
+
+# A general engine for puzzles like this one. Every name belongs to a group, and the names of a group
+# sit at distinct positions (days, here). A clause is a predicate whose argument names are the names
+# it talks about; position names are constants. The search binds one name at a time and checks each
+# clause as soon as all of its names are bound, instead of testing every clause on every candidate.
+
+# kind and params describe the clauses made by the typed helpers (same, different, after, either,
+# one_of_two), so that solvers which propagate constraints can recognise them; other clauses are 'pred'.
+Clause = namedtuple('Clause', 'pred names label kind params')
+
+class Puzzle(object):
+    "A logic puzzle over positions: groups of names that take distinct positions, and clauses over names."
+
+    def __init__(self, positions):
+        self.positions = list(positions)
+        self.groups = []
+        self.clauses = []
+        self.plan = None # see optimize()
+        self.tables = None # see logic_tables.compiled()
+
+    def group(self, *names):
+        "Declare names that must all take different positions."
+        self.groups.append(names)
+
+    def clause(self, pred, label=None):
+        "Require pred to hold; its argument names say which names it is about."
+        code = pred.func_code
+        names = code.co_varnames[:code.co_argcount]
+        self.clauses.append(Clause(pred, names, label or ' '.join(names), 'pred', ()))
+
+    def same(self, a, b, label=None):
+        "a and b are at the same position."
+        self._typed('same', (a, b), (), lambda a, b: a == b, label or '%s is %s' % (a, b))
+
+    def different(self, a, b, label=None):
+        self._typed('different', (a, b), (), lambda a, b: a != b, label or '%s is not %s' % (a, b))
+
+    def after(self, a, b, gap=1, label=None):
+        "a is gap positions after b."
+        self._typed('after', (a, b), (gap,), lambda a, b: a == b + gap, label or '%s is after %s' % (a, b))
+
+    def either(self, (a, b), (c, d), label=None):
+        "a is b, or c is d."
+        self._typed('either', (a, b, c, d), (), lambda a, b, c, d: a == b or c == d,
+                    label or 'either %s is %s or %s is %s' % (a, b, c, d))
+
+    def one_of_two(self, (x, y), (p, q), label=None):
+        "Of x and y, one is p and the other is q."
+        self._typed('one_of_two', (x, y, p, q), (), lambda x, y, p, q: (x == p and y == q) or (x == q and y == p),
+                    label or 'of %s and %s, one is %s and the other %s' % (x, y, p, q))
+
+    def _typed(self, kind, names, params, pred, label):
+        self.clauses.append(Clause(pred, names, label, kind, params))
+
+    def variables(self):
+        return [name for group in self.groups for name in group]
+
+    def without(self, index):
+        "A copy of this puzzle without its index-th clause."
+        puzzle = Puzzle(self.positions)
+        puzzle.groups = list(self.groups)
+        puzzle.clauses = self.clauses[:index] + self.clauses[index+1:]
+        return puzzle
+
+def binding_order(puzzle):
+    """The names of puzzle in an order that lets clauses be checked early. Next is always the name that
+    completes the most clauses, then the one sharing the most clauses with names already bound, then
+    the one in the most clauses, then the first declared."""
+    unbound = puzzle.variables()
+    clauses = [set(clause.names) & set(unbound) for clause in puzzle.clauses]
+    order = []
+    while unbound:
+        left = set(unbound)
+        def score(name):
+            mine = [names for names in clauses if name in names]
+            return (sum(1 for names in mine if names & left == set([name])),
+                    sum(1 for names in mine if names - left), len(mine))
+        name = max(unbound, key=score)
+        unbound.remove(name)
+        order.append(name)
+    return order
+
+def search(puzzle, order=None, stats=None):
+    """Lazily generate every solution as a {name: position} dict, binding names in the given order
+    (or the order of the puzzle's plan, if it has one, or else binding_order()). stats['candidates']
+    counts positions tried."""
+    plan = puzzle.plan if _plan_fits(puzzle) else None
+    variables = list(order or (plan and plan.order) or binding_order(puzzle))
+    clauses = [puzzle.clauses[i] for i in plan.clauses] if plan else puzzle.clauses
+    nvars, npos = len(variables), len(puzzle.positions)
+    slots = dict((name, i) for (i, name) in enumerate(variables))
+    slots.update((name, nvars + p) for (p, name) in enumerate(puzzle.positions))
+    values = [None] * nvars + range(npos) # position constants live after the variables
+    group_of = dict((name, g) for (g, group) in enumerate(puzzle.groups) for name in group)
+    groups = [group_of[name] for name in variables]
+    checks = [[] for _ in range(nvars + 1)] # clauses to check once the name at each depth is bound
+    for clause in clauses:
+        if not all(name in slots for name in clause.names):
+            raise ValueError('clause %r mentions an unknown name' % clause.label)
+        args = [slots[name] for name in clause.names]
+        checks[max([a for a in args if a < nvars] or [-1]) + 1].append((clause.pred, args))
+    if not all(pred(*[values[a] for a in args]) for (pred, args) in checks[0]):
+        return
+    used = [0] * len(puzzle.groups) # bitmask of the positions taken in each group
+
+    def extend(depth):
+        if depth == nvars:
+            yield dict(zip(variables, values))
+            return
+        g = groups[depth]
+        for p in xrange(npos):
+            if used[g] >> p & 1:
+                continue
+            values[depth] = p
+            if stats is not None:
+                stats['candidates'] = stats.get('candidates', 0) + 1
+            if all(pred(*[values[a] for a in args]) for (pred, args) in checks[depth + 1]):
+                used[g] |= 1 << p
+                for solution in extend(depth + 1):
+                    yield solution
+                used[g] &= ~(1 << p)
+
+    for solution in extend(0):
+        yield solution
+
+def solve(puzzle):
+    "The first solution of puzzle, or None."
+    return next(search(puzzle), None)
+
+# Profiling and planning for search(). Clauses are checked in the order they were added, and names
+# are bound group by group in the order the groups were declared; neither is necessarily a good order.
+# profile() measures how often each clause is evaluated and how often it rejects, and optimize() uses
+# that to cache a Plan on the puzzle: names whose clauses reject most are bound first, so the groups
+# they belong to are taken up first, and the most selective clauses are checked first.
+
+ClauseStats = namedtuple('ClauseStats', 'label evaluated rejected')
+Plan = namedtuple('Plan', 'order clauses') # names in binding order; clause indexes in checking order
+
+def _plan_fits(puzzle):
+    "Is the puzzle's plan for the clauses and names it has now?"
+    plan = puzzle.plan
+    return (plan is not None and sorted(plan.clauses) == range(len(puzzle.clauses))
+            and sorted(plan.order) == sorted(puzzle.variables()))
+
+def profile(puzzle):
+    "Search the whole of puzzle, counting how often each clause is evaluated and how often it rejects."
+    counts = [[0, 0] for _ in puzzle.clauses]
+    def counted(pred, count):
+        def check(*values):
+            count[0] += 1
+            if pred(*values):
+                return True
+            count[1] += 1
+            return False
+        return check
+    probe = Puzzle(puzzle.positions)
+    probe.groups, probe.plan = puzzle.groups, puzzle.plan
+    probe.clauses = [clause._replace(pred=counted(clause.pred, count)) for (clause, count) in zip(puzzle.clauses, counts)]
+    for _ in search(probe):
+        pass
+    return [ClauseStats(clause.label, evaluated, rejected) for (clause, (evaluated, rejected)) in zip(puzzle.clauses, counts)]
+
+def rejection_rate(stats):
+    return stats.rejected / float(stats.evaluated) if stats.evaluated else 0.0
+
+def report(stats):
+    "A printable table of profile() results, most selective clause first."
+    lines = ['%-50s %10s %10s %6s' % ('clause', 'evaluated', 'rejected', 'rate')]
+    for s in sorted(stats, key=rejection_rate, reverse=True):
+        lines.append('%-50s %10d %10d %5.1f%%' % (s.label[:50], s.evaluated, s.rejected, 100 * rejection_rate(s)))
+    return '\n'.join(lines)
+
+def optimize(puzzle):
+    "Profile puzzle and cache on it, as puzzle.plan, a better binding and checking order for search()."
+    puzzle.plan = None
+    stats = profile(puzzle)
+    rates = map(rejection_rate, stats)
+    variables = set(puzzle.variables())
+    needs = [set(clause.names) & variables for clause in puzzle.clauses]
+    order, unbound = [], puzzle.variables()
+    while unbound:
+        def gain(name): # rejection power of the clauses name takes part in, shared out among their unbound names
+            return sum(rate / len(names) for (rate, names) in zip(rates, needs) if name in names)
+        name = max(unbound, key=gain)
+        unbound.remove(name)
+        order.append(name)
+        for names in needs:
+            names.discard(name)
+    puzzle.plan = Plan(order, sorted(range(len(stats)), key=lambda i: rates[i], reverse=True))
+    return puzzle.plan
+
+BACKENDS = ['search', 'csp', 'sat', 'tables']
+
+def solutions(puzzle, backend='csp', stats=None):
+    """Lazily generate every solution of puzzle as a {name: position} dict, using the named backend.
+    If stats is a dict, stats['candidates'] counts the assignments the backend tried."""
+    if backend == 'search':
+        return search(puzzle, stats=stats)
+    elif backend == 'csp':
+        from logic_csp import csp_solutions
+        return csp_solutions(puzzle, stats)
+    elif backend == 'sat':
+        from logic_sat import sat_solutions
+        return sat_solutions(puzzle, stats)
+    elif backend == 'tables':
+        from logic_tables import table_solutions
+        return table_solutions(puzzle, stats)
+    raise ValueError('unknown backend %r' % backend)
+
+def is_unique(puzzle, backend='csp'):
+    "Does puzzle have exactly one solution? Stops as soon as a second solution turns up."
+    return len(list(itertools.islice(solutions(puzzle, backend), 2))) == 1
+
+def arrivals_puzzle():
+    "The puzzle above as a Puzzle; a person's position is the day they arrive."
+    puzzle = Puzzle(DAYS)
+    puzzle.group('wilkes', 'hamming', 'knuth', 'minsky', 'simon')
+    puzzle.group('laptop', 'droid', 'tablet', 'iphone')
+    puzzle.group('programmer', 'writer', 'manager', 'designer')
+    puzzle.same('laptop', 'wednesday', '1. Wednesday bought the laptop')
+    puzzle.different('programmer', 'wilkes', '2. the programmer is not Wilkes')
+    puzzle.one_of_two(('programmer', 'droid'), ('wilkes', 'hamming'), '3. programmer and droid are Wilkes and Hamming')
+    puzzle.different('writer', 'minsky', '4. the writer is not Minsky')
+    puzzle.different('knuth', 'manager', '5. Knuth is not the manager')
+    puzzle.different('tablet', 'manager', '5. the tablet is not the manager')
+    puzzle.after('knuth', 'simon', 1, '6. Knuth arrived the day after Simon')
+    puzzle.different('designer', 'thursday', '7. Thursday is not the designer')
+    puzzle.different('tablet', 'friday', "8. Friday didn't buy the tablet")
+    puzzle.different('designer', 'droid', "9. the designer didn't buy the droid")
+    puzzle.after('knuth', 'manager', 1, '10. Knuth arrived the day after the manager')
+    puzzle.one_of_two(('laptop', 'wilkes'), ('monday', 'writer'), '11. laptop and Wilkes are Monday and the writer')
+    puzzle.either(('iphone', 'tuesday'), ('tablet', 'tuesday'), '12. the iphone or the tablet arrived on Tuesday')
+    return puzzle
+
+def small_puzzle():
+    "A puzzle for tests: names a, b, c and x, y over three positions, with a before b."
+    puzzle = Puzzle(['first', 'second', 'third'])
+    puzzle.group('a', 'b', 'c')
+    puzzle.group('x', 'y')
+    puzzle.clause(lambda a, b: a < b)
+    return puzzle
+
+def arrival_order(solution):
+    "The names of the PERSONS in order of arrival."
+    order = [None] * len(PERSONS)
+    for person in PERSONS:
+        order[solution[person.lower()]] = person
+    return order
+
 def test_unit():
     assert ['Wilkes', 'Simon', 'Knuth', 'Hamming', 'Minsky'] == logic_puzzle()
     print 'test pass'
 
+def test_parallel():
+    assert logic_puzzle_parallel(processes=2) == logic_puzzle()
+    assert logic_puzzle_parallel(processes=3, shards=120) == logic_puzzle()
+    assert logic_puzzle_parallel(processes=1, shards=1) == logic_puzzle()
+    print 'parallel tests pass'
+
+def test_search():
+    puzzle = arrivals_puzzle()
+    assert arrival_order(solve(puzzle)) == logic_puzzle()
+    assert len(list(search(puzzle))) == 1
+    assert arrival_order(solve(puzzle)) == arrival_order(next(search(puzzle, reversed(puzzle.variables()))))
+    order = binding_order(puzzle)
+    assert sorted(order) == sorted(puzzle.variables()) and order[0] == 'tablet' # in clue 8 alone, and two more
+    by_group, connected = {}, {}
+    assert list(search(puzzle, puzzle.variables(), by_group)) == list(search(puzzle, stats=connected))
+    assert connected['candidates'] < by_group['candidates']
+    from logic_bench import random_puzzle
+    big, answer = random_puzzle(7, 5, seed=0) # declaration order takes about 30M candidates
+    stats = {}
+    assert list(search(big, stats=stats)) == [answer] and stats['candidates'] < 10 ** 5
+    small = Puzzle(['first', 'second', 'third'])
+    small.group('a', 'b', 'c')
+    small.group('x', 'y')
+    assert len(list(search(small))) == 6 * 6
+    small.clause(lambda a, b: a < b)
+    small.same('x', 'c')
+    assert len(list(search(small))) == 3 * 2
+    small.clause(lambda b, first: b == first)
+    assert list(search(small)) == []
+    small.clause(lambda nobody: True)
+    try:
+        solve(small)
+        assert False
+    except ValueError:
+        pass
+    print 'search tests pass'
+
+def test_optimize():
+    puzzle = arrivals_puzzle()
+    stats = profile(puzzle)
+    assert [s.label for s in stats] == [clause.label for clause in puzzle.clauses]
+    assert all(0 <= s.rejected <= s.evaluated for s in stats) and stats[0].evaluated > 0
+    assert report(stats).count('\n') == len(stats)
+    plan = optimize(puzzle)
+    assert puzzle.plan == plan and sorted(plan.order) == sorted(puzzle.variables())
+    assert list(search(puzzle)) == list(search(arrivals_puzzle()))
+    work = lambda stats: sum(s.evaluated for s in stats)
+    assert work(profile(puzzle)) < work(stats)
+    puzzle.different('hamming', 'thursday')
+    assert not _plan_fits(puzzle) and solve(puzzle) is None
+    print 'optimize tests pass'
+
+def test_solutions():
+    for backend in BACKENDS:
+        puzzle = arrivals_puzzle()
+        assert [arrival_order(s) for s in solutions(puzzle, backend)] == [logic_puzzle()]
+        assert is_unique(puzzle, backend)
+        puzzle.clauses.pop() # without clue 12 there are more answers
+        assert not is_unique(puzzle, backend) and len(list(solutions(puzzle, backend))) == 2
+        puzzle.different('wilkes', 'monday')
+        puzzle.different('wilkes', 'writer') # contradicts clue 11
+        assert not is_unique(puzzle, backend) and next(solutions(puzzle, backend), None) is None
+    try:
+        solutions(arrivals_puzzle(), 'oracle')
+        assert False
+    except ValueError:
+        pass
+    print 'solutions tests pass'
+
 if __name__ == '__main__':
     test_unit()
+    test_parallel()
+    test_search()
+    test_optimize()
+    test_solutions()
     
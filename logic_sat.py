@@ -0,0 +1,380 @@
+"""
+SAT backend for logic puzzles
+-----------------------------
+
+Another backend for the Puzzle objects of logic_puzzle.py. The puzzle is
+encoded as CNF: a boolean variable at(name, p) for each name and position,
+exactly one position per name, at most one name of a group per position
+(and at least one when the group fills every position). Each clause becomes
+a few CNF clauses; either and one_of_two get a selector variable per
+alternative, and any other predicate forbids its failing combinations.
+
+The CNF is solved by a small conflict-driven clause learning solver in pure
+Python, with two watched literals per clause, first-UIP learning,
+non-chronological backjumping, activity-ordered decisions and Luby restarts.
+Literals are non-zero integers, -v being the negation of v, as in DIMACS.
+Solutions are enumerated with one solver: after each model it goes back to
+level 0, takes a clause blocking that model and solves again, keeping what
+it has learned.
+"""
+import heapq
+import itertools
+
+class CNF(object):
+    "A growing set of clauses over numbered variables."
+
+    def __init__(self):
+        self.nvars = 0
+        self.clauses = []
+
+    def var(self):
+        self.nvars += 1
+        return self.nvars
+
+    def add(self, lits):
+        "Add the clause lits. True and False may appear as literals that are already decided."
+        if any(lit is True for lit in lits): # not 'True in lits': 1 == True
+            return
+        self.clauses.append([lit for lit in lits if lit is not False])
+
+class PuzzleCNF(CNF):
+    "The CNF encoding of a puzzle."
+
+    def __init__(self, puzzle):
+        CNF.__init__(self)
+        self.puzzle = puzzle
+        self.npos = len(puzzle.positions)
+        self.constants = dict((name, p) for (p, name) in enumerate(puzzle.positions))
+        self.at_var = {}
+        for name in puzzle.variables():
+            self.at_var[name] = [self.var() for _ in range(self.npos)]
+            self.add(self.at_var[name]) # somewhere
+            for (a, b) in itertools.combinations(self.at_var[name], 2):
+                self.add([-a, -b]) # only one place
+        for group in puzzle.groups:
+            for p in range(self.npos):
+                lits = [self.at_var[name][p] for name in group]
+                for (a, b) in itertools.combinations(lits, 2):
+                    self.add([-a, -b])
+                if len(group) == self.npos:
+                    self.add(lits)
+        for clause in puzzle.clauses:
+            self.add_clause(clause)
+
+    def at(self, name, p):
+        "The literal for 'name is at position p' (True or False for constants and positions off the end)."
+        if not 0 <= p < self.npos:
+            return False
+        if name in self.constants:
+            return self.constants[name] == p
+        if name not in self.at_var:
+            raise ValueError('unknown name %r' % name)
+        return self.at_var[name][p]
+
+    def equal(self, a, b, guard=None):
+        "Clauses for a == b, all disabled when the literal guard is false."
+        unless = [-guard] if guard else []
+        for p in range(self.npos):
+            self.add(unless + [_neg(self.at(a, p)), self.at(b, p)])
+            self.add(unless + [_neg(self.at(b, p)), self.at(a, p)])
+
+    def add_clause(self, clause):
+        kind, names = clause.kind, clause.names
+        if kind == 'same':
+            self.equal(*names)
+        elif kind == 'different':
+            a, b = names
+            for p in range(self.npos):
+                self.add([_neg(self.at(a, p)), _neg(self.at(b, p))])
+        elif kind == 'after':
+            (a, b), (gap,) = names, clause.params
+            for p in range(self.npos):
+                self.add([_neg(self.at(a, p)), self.at(b, p - gap)])
+                self.add([_neg(self.at(b, p)), self.at(a, p + gap)])
+        elif kind == 'either':
+            a, b, c, d = names
+            first, second = self.var(), self.var()
+            self.add([first, second])
+            self.equal(a, b, first)
+            self.equal(c, d, second)
+        elif kind == 'one_of_two':
+            x, y, p, q = names
+            straight, crossed = self.var(), self.var()
+            self.add([straight, crossed])
+            self.equal(x, p, straight)
+            self.equal(y, q, straight)
+            self.equal(x, q, crossed)
+            self.equal(y, p, crossed)
+        else: # forbid every combination of positions the predicate rejects
+            for values in itertools.product(range(self.npos), repeat=len(names)):
+                if not clause.pred(*values):
+                    self.add([_neg(self.at(name, p)) for (name, p) in zip(names, values)])
+
+    def decode(self, model):
+        "The {name: position} solution for a satisfying model (a set of true literals)."
+        return dict((name, next(p for (p, v) in enumerate(lits) if v in model))
+                    for (name, lits) in self.at_var.items())
+
+def _neg(lit):
+    return not lit if isinstance(lit, bool) else -lit
+
+def luby(i):
+    "The i-th term (from 1) of the Luby restart sequence 1 1 2 1 1 2 4 1 1 2 ..."
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    if (1 << k) - 1 == i:
+        return 1 << (k - 1)
+    return luby(i - (1 << (k - 1)) + 1)
+
+class Solver(object):
+    "A CDCL SAT solver. solve() returns a set of true literals, or None if the clauses are unsatisfiable."
+
+    RESTART_BASE = 64 # conflicts per unit of the Luby sequence
+    DECAY = 0.95
+    RESCALE = 1e100 # activities and bump are scaled down once bump passes this
+
+    def __init__(self, nvars, clauses):
+        self.nvars = nvars
+        self.value = [None] * (nvars + 1) # True, False or None per variable
+        self.level = [0] * (nvars + 1)
+        self.reason = [None] * (nvars + 1) # the clause that forced each variable
+        self.activity = [0.0] * (nvars + 1)
+        self.bump = 1.0
+        self.heap = [(-0.0, var) for var in range(1, nvars + 1)] # (-activity, var); every unassigned var is in it
+        self.trail = []
+        self.limits = [] # trail length at the start of each decision level
+        self.watches = {} # literal -> clauses watching it; a clause watches its first two literals
+        self.clauses = []
+        self.conflicts = self.decisions = 0
+        self.ok = True
+        for lits in clauses:
+            self.add(list(set(lits)))
+
+    def add(self, lits):
+        "Add a clause; only at decision level 0, where it drops the literals already false."
+        if any(-lit in lits for lit in lits) or any(self.lit_value(lit) is True for lit in lits):
+            return # always true
+        lits = [lit for lit in lits if self.lit_value(lit) is None]
+        if not lits:
+            self.ok = False
+        elif len(lits) == 1:
+            if self.lit_value(lits[0]) is False:
+                self.ok = False
+            elif self.lit_value(lits[0]) is None:
+                self.assign(lits[0], None)
+        else:
+            self.clauses.append(lits)
+            self.watch(lits)
+
+    def watch(self, clause):
+        for lit in clause[:2]:
+            self.watches.setdefault(lit, []).append(clause)
+
+    def lit_value(self, lit):
+        value = self.value[abs(lit)]
+        if value is None:
+            return None
+        return value if lit > 0 else not value
+
+    def assign(self, lit, reason):
+        var = abs(lit)
+        self.value[var] = lit > 0
+        self.level[var] = len(self.limits)
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    def propagate(self, start):
+        "Unit-propagate the trail from index start. Returns a conflicting clause, or None."
+        i = start
+        while i < len(self.trail):
+            false_lit = -self.trail[i]
+            i += 1
+            watching = self.watches.get(false_lit, [])
+            kept = []
+            for (n, clause) in enumerate(watching):
+                if clause[0] == false_lit: # keep the false literal in slot 1
+                    clause[0], clause[1] = clause[1], clause[0]
+                if self.lit_value(clause[0]) is True:
+                    kept.append(clause)
+                    continue
+                for k in xrange(2, len(clause)):
+                    if self.lit_value(clause[k]) is not False: # found a new literal to watch
+                        clause[1], clause[k] = clause[k], clause[1]
+                        self.watches.setdefault(clause[1], []).append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if self.lit_value(clause[0]) is False:
+                        self.watches[false_lit] = kept + watching[n+1:]
+                        return clause
+                    self.assign(clause[0], clause)
+            self.watches[false_lit] = kept
+        return None
+
+    def analyze(self, conflict):
+        "First-UIP conflict analysis. Returns the learned clause (asserting literal first) and the level to jump back to."
+        level = len(self.limits)
+        seen = set()
+        learned = [None]
+        pending = 0
+        lit = None
+        index = len(self.trail)
+        clause = conflict
+        while True:
+            for other in clause:
+                if other == lit:
+                    continue
+                var = abs(other)
+                if var not in seen and self.level[var] > 0:
+                    seen.add(var)
+                    self.activity[var] += self.bump
+                    if self.level[var] == level:
+                        pending += 1
+                    else:
+                        learned.append(other)
+            while True: # the next literal of the current level on the trail
+                index -= 1
+                lit = self.trail[index]
+                if abs(lit) in seen:
+                    break
+            pending -= 1
+            if pending == 0:
+                break
+            clause = self.reason[abs(lit)]
+        learned[0] = -lit
+        self.bump /= self.DECAY
+        if self.bump > self.RESCALE:
+            self.rescale()
+        if len(learned) == 1:
+            return learned, 0
+        back = max(range(1, len(learned)), key=lambda k: self.level[abs(learned[k])])
+        learned[1], learned[back] = learned[back], learned[1] # watch the literal of the highest other level
+        return learned, self.level[abs(learned[1])]
+
+    def rescale(self):
+        self.activity = [a / self.RESCALE for a in self.activity]
+        self.bump /= self.RESCALE
+        self.heap = [(-self.activity[var], var) for var in range(1, self.nvars + 1) if self.value[var] is None]
+        heapq.heapify(self.heap)
+
+    def backjump(self, level):
+        if len(self.limits) > level:
+            for lit in self.trail[self.limits[level]:]:
+                var = abs(lit)
+                self.value[var] = self.reason[var] = None
+                heapq.heappush(self.heap, (-self.activity[var], var))
+            del self.trail[self.limits[level]:]
+            del self.limits[level:]
+
+    def decide(self):
+        """Pick the unassigned variable with the highest activity (the lowest numbered of equals), set
+        false first; None when all are set. Heap entries of assigned variables, or older activities
+        of bumped ones, are dropped as they come up."""
+        while self.heap:
+            key, var = heapq.heappop(self.heap)
+            if self.value[var] is None and -key == self.activity[var]:
+                return -var
+        return None
+
+    def solve(self):
+        """A model, or None; it may be called again after add()ing clauses, e.g. one that blocks the
+        last model, and carries on with what it has learned."""
+        self.backjump(0)
+        if not self.ok or self.propagate(0) is not None:
+            self.ok = False
+            return None
+        restarts = 1
+        budget = self.RESTART_BASE * luby(restarts)
+        while True:
+            start = len(self.trail)
+            lit = self.decide()
+            if lit is None:
+                return set(self.trail)
+            self.decisions += 1
+            self.limits.append(start)
+            self.assign(lit, None)
+            conflict = self.propagate(start)
+            while conflict is not None:
+                self.conflicts += 1
+                budget -= 1
+                if not self.limits:
+                    return None
+                learned, level = self.analyze(conflict)
+                self.backjump(level)
+                start = len(self.trail)
+                if len(learned) == 1:
+                    self.assign(learned[0], None)
+                else:
+                    self.clauses.append(learned)
+                    self.watch(learned)
+                    self.assign(learned[0], learned)
+                conflict = self.propagate(start)
+            if budget <= 0:
+                restarts += 1
+                budget = self.RESTART_BASE * luby(restarts)
+                self.backjump(0)
+
+def sat_solutions(puzzle, stats=None):
+    """Lazily generate every solution of puzzle, blocking each one found before solving again.
+    stats['candidates'] counts decisions and stats['conflicts'] conflicts."""
+    cnf = PuzzleCNF(puzzle)
+    solver = Solver(cnf.nvars, cnf.clauses)
+    while True:
+        decisions, conflicts = solver.decisions, solver.conflicts
+        model = solver.solve()
+        if stats is not None:
+            stats['candidates'] = stats.get('candidates', 0) + solver.decisions - decisions
+            stats['conflicts'] = stats.get('conflicts', 0) + solver.conflicts - conflicts
+        if model is None:
+            return
+        solution = cnf.decode(model)
+        yield solution
+        solver.backjump(0)
+        solver.add([-cnf.at(name, p) for (name, p) in solution.items()])
+
+def sat_solve(puzzle):
+    "The first solution of puzzle, or None."
+    return next(sat_solutions(puzzle), None)
+
+def test_sat():
+    from logic_csp import chain_puzzle
+    from logic_puzzle import Puzzle, arrivals_puzzle, arrival_order, logic_puzzle, search, small_puzzle
+    assert [luby(i) for i in range(1, 16)] == [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8]
+    puzzle = arrivals_puzzle()
+    assert arrival_order(sat_solve(puzzle)) == logic_puzzle()
+    assert list(sat_solutions(puzzle)) == list(search(puzzle))
+    loose = arrivals_puzzle()
+    del loose.clauses[0]
+    assert sorted(sat_solutions(loose)) == sorted(search(loose))
+    assert len(list(sat_solutions(chain_puzzle(12)))) == 1
+    pigeons = [[i * 3 + j + 1 for j in range(3)] for i in range(4)] # 4 pigeons, 3 holes
+    clauses = pigeons + [[-a, -b] for j in range(3) for (a, b) in itertools.combinations([p[j] for p in pigeons], 2)]
+    assert Solver(12, clauses).solve() is None
+    assert Solver(2, [[1, 2], [-1], [-2, 1]]).solve() is None
+    assert Solver(3, [[1, 2], [-1, 3], [-3]]).solve() == set([-1, 2, -3])
+    small = small_puzzle()
+    small.after('x', 'c', -1)
+    assert sorted(sat_solutions(small)) == sorted(search(small))
+    loose = Puzzle(['a', 'b', 'c', 'd'])
+    loose.group('w', 'x', 'y', 'z')
+    loose.group('i', 'j', 'k', 'l')
+    loose.group('p', 'q', 'r')
+    loose.different('w', 'i')
+    loose.after('p', 'x')
+    stats = {}
+    assert sorted(sat_solutions(loose, stats)) == sorted(search(loose)) # 1944 solutions from one solver
+    assert stats['candidates'] > 0
+    solver = Solver(3, [[1, 2, 3]])
+    for lits in ([-1], [-2]):
+        assert solver.solve() is not None
+        solver.backjump(0)
+        solver.add(lits)
+    assert solver.solve() == set([-1, -2, 3])
+    solver.backjump(0)
+    solver.add([-3])
+    assert solver.solve() is None and solver.solve() is None
+    print 'sat tests pass'
+
+if __name__ == '__main__':
+    test_sat()
@@ -0,0 +1,183 @@
+"""
+Precompiled tables for logic puzzles
+------------------------------------
+
+A backend for the Puzzle objects of logic_puzzle.py that does its name and
+predicate work once, before searching. The ways to place a group's names at
+distinct positions are numbered, and placement i of a group is kept as k
+integers (the positions of its k names) in one flat array per group size.
+
+A clause about the names of one group becomes a bytearray with a byte per
+placement, and a clause about two groups a bytearray with a byte per pair of
+placements. The search binds one group at a time, and checking a placement
+is integer indexing into those tables. A clause over three or more groups,
+or whose table would be too big, is checked by calling its predicate once
+all of its groups are placed.
+
+The compiled Tables are cached on the puzzle and reused for as long as its
+positions, groups and clauses stay the same.
+"""
+import array
+import itertools
+
+PLACEMENT_LIMIT = 1 << 20 # most placements of one group
+TABLE_LIMIT = 1 << 20 # most entries in the table of one clause
+
+_PLACEMENTS = {} # (npos, k) -> flat array of the positions of every placement
+
+def count_placements(npos, k):
+    "The number of ways to put k names at distinct positions out of npos."
+    total = 1
+    for n in range(npos - k + 1, npos + 1):
+        total *= n
+    return total
+
+def placements(npos, k):
+    "Every placement of k names at distinct positions out of npos, flattened: placement i is [i*k:i*k+k]."
+    key = (npos, k)
+    if key not in _PLACEMENTS:
+        if count_placements(npos, k) > PLACEMENT_LIMIT:
+            raise ValueError('%d names over %d positions have too many placements to tabulate' % (k, npos))
+        _PLACEMENTS[key] = array.array('B', itertools.chain.from_iterable(itertools.permutations(range(npos), k)))
+    return _PLACEMENTS[key]
+
+class Tables(object):
+    "A puzzle compiled to numbered placements for each group and lookup tables for its clauses."
+
+    def __init__(self, puzzle):
+        self.positions = list(puzzle.positions)
+        self.groups = list(puzzle.groups)
+        self.clauses = list(puzzle.clauses)
+        npos = len(self.positions)
+        self.places = [placements(npos, len(group)) for group in self.groups]
+        self.sizes = [count_placements(npos, len(group)) for group in self.groups]
+        self.offsets = [0] # where each group's positions start in a row of values, constants last
+        for group in self.groups:
+            self.offsets.append(self.offsets[-1] + len(group))
+        self.slot = dict((name, self.offsets[g] + j) for (g, group) in enumerate(self.groups)
+                         for (j, name) in enumerate(group))
+        self.slot.update((name, self.offsets[-1] + p) for (p, name) in enumerate(self.positions))
+        self.group_of = dict((name, g) for (g, group) in enumerate(self.groups) for name in group)
+        self.allowed = [range(size) for size in self.sizes] # placements every one-group clause accepts
+        self.pairs = [[] for _ in self.groups] # (h, table) for the two-group clauses with an earlier group h
+        self.late = [[] for _ in self.groups] # (pred, args) to call once the group is placed
+        self.contradiction = False
+        for clause in self.clauses:
+            self.add_clause(clause)
+
+    def add_clause(self, clause):
+        if not all(name in self.slot for name in clause.names):
+            raise ValueError('clause %r mentions an unknown name' % clause.label)
+        gs = sorted(set(self.group_of[name] for name in clause.names if name in self.group_of))
+        if not gs: # about positions only
+            if not clause.pred(*[self.positions.index(name) for name in clause.names]):
+                self.contradiction = True
+        elif len(gs) == 1:
+            table = self.table(clause, gs)
+            g = gs[0]
+            self.allowed[g] = [i for i in self.allowed[g] if table[i]]
+        elif len(gs) == 2 and self.sizes[gs[0]] * self.sizes[gs[1]] <= TABLE_LIMIT:
+            self.pairs[gs[1]].append((gs[0], self.table(clause, gs)))
+        else:
+            self.late[gs[-1]].append((clause.pred, [self.slot[name] for name in clause.names]))
+
+    def table(self, clause, gs):
+        "A bytearray of clause's truth for each combination of placements of the groups gs, last group fastest."
+        starts, start = {}, 0
+        for g in gs:
+            starts[g] = start
+            start += len(self.groups[g])
+        args = [starts[self.group_of[name]] + self.groups[self.group_of[name]].index(name) if name in self.group_of
+                else start + self.positions.index(name) for name in clause.names]
+        constants = range(len(self.positions))
+        rows = [[self.places[g][i*len(self.groups[g]):(i+1)*len(self.groups[g])] for i in xrange(self.sizes[g])]
+                for g in gs]
+        pred = clause.pred
+        table = bytearray()
+        for combination in itertools.product(*rows):
+            values = list(itertools.chain(*combination)) + constants
+            table.append(bool(pred(*[values[a] for a in args])))
+        return table
+
+    def solutions(self, stats=None):
+        "Lazily generate every solution as a {name: position} dict; stats['candidates'] counts placements tried."
+        if self.contradiction:
+            return
+        ngroups = len(self.groups)
+        chosen = [0] * ngroups
+        values = [0] * self.offsets[-1] + range(len(self.positions))
+
+        def extend(g):
+            if g == ngroups:
+                yield dict((name, values[self.slot[name]]) for group in self.groups for name in group)
+                return
+            pairs, late, size = self.pairs[g], self.late[g], self.sizes[g]
+            places, k, start = self.places[g], len(self.groups[g]), self.offsets[g]
+            for i in self.allowed[g]:
+                if stats is not None:
+                    stats['candidates'] = stats.get('candidates', 0) + 1
+                if not all(table[chosen[h] * size + i] for (h, table) in pairs):
+                    continue
+                chosen[g] = i
+                values[start:start+k] = places[i*k:i*k+k]
+                if all(pred(*[values[a] for a in args]) for (pred, args) in late):
+                    for solution in extend(g + 1):
+                        yield solution
+
+        for solution in extend(0):
+            yield solution
+
+def _fits(tables, puzzle):
+    "Were tables compiled from the positions, groups and clauses puzzle has now?"
+    return (tables.positions == puzzle.positions and tables.groups == puzzle.groups
+            and tables.clauses == puzzle.clauses)
+
+def compiled(puzzle):
+    "The Tables of puzzle, compiled on first use and cached on it as puzzle.tables."
+    if puzzle.tables is None or not _fits(puzzle.tables, puzzle):
+        puzzle.tables = Tables(puzzle)
+    return puzzle.tables
+
+def table_solutions(puzzle, stats=None):
+    "Lazily generate every solution of puzzle as a {name: position} dict."
+    return compiled(puzzle).solutions(stats)
+
+_ARRIVALS = [] # the arrivals puzzle of logic_puzzle.py, compiled on the first call
+
+def logic_puzzle_compiled():
+    "logic_puzzle() searched over precompiled tables; the clues are compiled once, on the first call."
+    from logic_puzzle import arrivals_puzzle, arrival_order
+    if not _ARRIVALS:
+        _ARRIVALS.append(compiled(arrivals_puzzle()))
+    return arrival_order(next(_ARRIVALS[0].solutions()))
+
+def test_tables():
+    from logic_puzzle import arrivals_puzzle, logic_puzzle, search, small_puzzle
+    assert logic_puzzle_compiled() == logic_puzzle() == logic_puzzle_compiled()
+    assert len(placements(5, 4)) == 4 * count_placements(5, 4) == 4 * 120
+    assert list(placements(3, 2)[:6]) == [0, 1, 0, 2, 1, 0]
+    puzzle = arrivals_puzzle()
+    tables = compiled(puzzle)
+    assert compiled(puzzle) is tables and list(table_solutions(puzzle)) == list(search(puzzle))
+    assert all(len(table) == 120 * 120 for pairs in tables.pairs for (_, table) in pairs)
+    puzzle.clauses.pop()
+    assert compiled(puzzle) is not tables and len(list(table_solutions(puzzle))) == 2
+    small = small_puzzle()
+    small.group('u')
+    small.clause(lambda a, x, u: a + x != u) # three groups: checked by calling it
+    small.after('x', 'c', -1)
+    stats = {}
+    assert sorted(table_solutions(small, stats)) == sorted(search(small)) and stats['candidates'] > 0
+    assert compiled(small).late[2]
+    small.different('first', 'first')
+    assert list(table_solutions(small)) == []
+    small.clause(lambda nobody: True)
+    try:
+        compiled(small)
+        assert False
+    except ValueError:
+        pass
+    print 'tables tests pass'
+
+if __name__ == '__main__':
+    test_tables()
@@ -50,12 +50,249 @@ forum. Note (5) The test examples will involve no more than a dozen or so
 input words. But you could implement a method that is efficient with a
 larger list of words.
 """
+import heapq
+import multiprocessing
 import re
+import sys
 from collections import deque
 
 
-def natalie(words):
-    "Find the best Portmanteau word formed from any two of the list of words."
+def natalie(words, backend='index'):
+    """Find the best Portmanteau word formed from any two of the list of words. The backend that finds
+    the overlaps between words is 'index' (see overlaps) or 'automaton' (see automaton_overlaps)."""
+    if backend not in OVERLAPS:
+        raise ValueError('unknown backend %r' % backend)
+    return best_portmanteau(OVERLAPS[backend](words))
+
+def prefix_index(words):
+    """Map every non-empty prefix of every word (the whole word too) to the positions in words of the
+    words that start with it."""
+    index = {}
+    for (n, word) in enumerate(words):
+        for i in range(1, len(word) + 1):
+            index.setdefault(word[:i], []).append(n)
+    return index
+
+def overlaps(words, index=None):
+    """Generate (start, mid, end, first, second) for every way to join two different words, where the
+    first word is start+mid letters long and the second mid+end, sharing the mid letters. They come in
+    the order natalie_regex() finds them: by first word, then by split point, then by second word."""
+    if index is None:
+        index = prefix_index(words)
+    for word in words:
+        for i in range(1, len(word)):
+            mid = word[i:]
+            for n in index.get(mid, ()):
+                other = words[n]
+                if other != word:
+                    yield (i, len(mid), len(other) - len(mid), word, other)
+
+class Automaton(object):
+    """An Aho-Corasick automaton over words: a trie of every prefix of every word, in which each node's
+    failure link goes to the node of its longest proper suffix that is a prefix too. Following the links
+    from a word's node visits, longest first, every suffix of the word that begins some word."""
+
+    def __init__(self, words):
+        self.words = words
+        self.children = [{}]
+        self.depth = [0]
+        self.starts = [[]] # positions in words of the words that start with each node's prefix
+        self.ends = [] # the node of each word
+        for (n, word) in enumerate(words):
+            node = 0
+            for ch in word:
+                child = self.children[node].get(ch)
+                if child is None:
+                    child = self.children[node][ch] = len(self.children)
+                    self.children.append({})
+                    self.depth.append(self.depth[node] + 1)
+                    self.starts.append([])
+                node = child
+                self.starts[node].append(n)
+            self.ends.append(node)
+        self.fail = [0] * len(self.children)
+        queue = deque(self.children[0].values()) # breadth first, so shorter prefixes are linked first
+        while queue:
+            node = queue.popleft()
+            for (ch, child) in self.children[node].items():
+                f = self.fail[node]
+                while f and ch not in self.children[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.children[f].get(ch, 0)
+                queue.append(child)
+
+    def overlaps(self):
+        "Generate the same (start, mid, end, first, second) candidates as overlaps(), in the same order."
+        words, depth, starts, fail = self.words, self.depth, self.starts, self.fail
+        for (m, word) in enumerate(words):
+            node = fail[self.ends[m]]
+            while node:
+                mid = depth[node]
+                for n in starts[node]:
+                    other = words[n]
+                    if other != word:
+                        yield (len(word) - mid, mid, len(other) - mid, word, other)
+                node = fail[node]
+
+def automaton_overlaps(words):
+    "overlaps(), found by walking the failure links of an Aho-Corasick automaton over the words."
+    return Automaton(words).overlaps()
+
+OVERLAPS = {'index': overlaps, 'automaton': automaton_overlaps}
+
+def portmanteau_score(start, mid, end):
+    "The score of a portmanteau from the lengths of its start, mid and end."
+    length = start + mid + end
+    return length - abs(start - length/4) - abs(mid - length/2) - abs(end - length/4)
+
+def best_portmanteau(candidates):
+    """The best portmanteau of the (start, mid, end, first, second) candidates, or None, picked as
+    natalie_regex() picks: a candidate wins over a lower score, and over none or a score of 0."""
+    best, best_score = None, None
+    for (start, mid, end, first, second) in candidates:
+        score = portmanteau_score(start, mid, end)
+        if not best_score or best_score < score:
+            best, best_score = first[:start] + second, score
+    return best
+
+def score_bounds(words):
+    """split_bound(start, mid), the most a split of a word into start+mid can score with any second word
+    as long as some word is, and the list of the most each word can score over all its splits."""
+    lengths = sorted(set(len(word) for word in words))
+    split_bounds = {}
+    def split_bound(start, mid):
+        if (start, mid) not in split_bounds:
+            split_bounds[start, mid] = max([portmanteau_score(start, mid, n - mid) for n in lengths if n >= mid] or [None])
+        return split_bounds[start, mid]
+    return split_bound, [max([split_bound(i, len(word) - i) for i in range(1, len(word))] or [None]) for word in words]
+
+def natalie_bounded(words, index=None):
+    """natalie(), without looking at most candidates. A split of a word into start+mid can score at
+    most the best score over the lengths words come in, so words are searched in decreasing order of
+    that bound, splits that cannot reach the best so far are skipped, and the search stops at the
+    first word that cannot. Ties go to the candidate natalie() meets first. Only when no portmanteau
+    scores above 0, and natalie()'s choice depends on the order of every candidate, is every one looked at."""
+    if index is None:
+        index = prefix_index(words)
+    split_bound, bounds = score_bounds(words)
+    best = best_candidate(words, index, range(len(words)), split_bound, bounds)
+    if best is None or best[0] <= 0:
+        return best_portmanteau(overlaps(words, index))
+    return best[2]
+
+def best_candidate(words, index, firsts, split_bound, bounds, floor=None):
+    """(score, (m, i, n), portmanteau) for the best candidate whose first word is words[m] for m in
+    firsts, searched as natalie_bounded() describes; ties go to the smallest (m, i, n), the candidate
+    natalie() meets first. None if there is none. floor, if given, is a shared multiprocessing.Value
+    holding a score some other search has reached: nothing that cannot reach it is searched."""
+    best = None
+    for m in sorted(firsts, key=lambda m: bounds[m], reverse=True): # words that cannot split come last
+        if bounds[m] is None or best and bounds[m] < best[0] or floor is not None and bounds[m] < floor.value:
+            break
+        if best and bounds[m] == best[0] and m > best[1][0]: # could only tie, and natalie() meets the best first
+            continue
+        word = words[m]
+        for i in range(1, len(word)):
+            mid = len(word) - i
+            if best and split_bound(i, mid) < best[0] or floor is not None and split_bound(i, mid) < floor.value:
+                continue
+            for n in index.get(word[i:], ()):
+                other = words[n]
+                if other == word:
+                    continue
+                score = portmanteau_score(i, mid, len(other) - mid)
+                if best is None or score > best[0] or score == best[0] and (m, i, n) < best[1]:
+                    best = (score, (m, i, n), word[:i] + other)
+                    if floor is not None and score > floor.value:
+                        with floor.get_lock():
+                            floor.value = max(floor.value, score)
+    return best
+
+# natalie_parallel() puts (words, index, split_bound, bounds, floor) here before starting its pool, and
+# the worker processes inherit it when they fork, so the index is built once and never pickled.
+_SHARED = None
+
+def _shard_best((start, step)):
+    "Worker for natalie_parallel: the best candidate whose first word is at start, start+step, ..."
+    words, index, split_bound, bounds, floor = _SHARED
+    return best_candidate(words, index, xrange(start, len(words), step), split_bound, bounds, floor)
+
+def natalie_parallel(words, processes=None, shards=None):
+    """natalie_bounded() with the first words dealt out to shards that a process pool searches at
+    once. The workers share the prefix index and the best score reached so far, and the best of
+    each shard is merged with the same score and tie-breaking as natalie()."""
+    global _SHARED
+    index = prefix_index(words)
+    split_bound, bounds = score_bounds(words)
+    shards = shards or 4 * (processes or multiprocessing.cpu_count())
+    _SHARED = (words, index, split_bound, bounds, multiprocessing.Value('l', -sys.maxint))
+    pool = multiprocessing.Pool(processes)
+    try:
+        found = [best for best in pool.map(_shard_best, [(start, shards) for start in range(shards)]) if best]
+    finally:
+        pool.terminate()
+        pool.join()
+        _SHARED = None
+    best = min(found, key=lambda (score, key, _): (-score, key)) if found else None
+    if best is None or best[0] <= 0:
+        return best_portmanteau(overlaps(words, index))
+    return best[2]
+
+def read_words(path):
+    "Generate the words of a word list file, one per line."
+    with open(path) as f:
+        for line in f:
+            word = line.strip()
+            if word:
+                yield word
+
+def ranked_portmanteaux(words, k=10):
+    """Generate the k best (score, portmanteau) pairs from words, best first, ties going to the one
+    natalie() meets first. Words are searched in the order natalie_bounded() uses, and each pair is
+    yielded as soon as no word left to search can beat it. Only the best k candidates are ever kept."""
+    if k < 1:
+        return
+    words = list(words)
+    index = prefix_index(words)
+    split_bound, bounds = score_bounds(words)
+    heap = [] # (score, key negated, portmanteau) for the best k so far, worst first; key is (m, i, n)
+    done = 0 # how many of the best have been yielded
+    last_bound = None
+    for m in sorted(range(len(words)), key=lambda m: bounds[m], reverse=True):
+        bound = bounds[m]
+        if bound is None or len(heap) == k and bound < heap[0][0]:
+            break
+        if bound != last_bound: # everything scoring more than bound is final
+            ranked = sorted(heap, reverse=True)
+            while done < len(ranked) and ranked[done][0] > bound:
+                yield ranked[done][0], ranked[done][2]
+                done += 1
+            last_bound = bound
+        if len(heap) == k and bound == heap[0][0] and m > -heap[0][1][0]:
+            continue
+        word = words[m]
+        for i in range(1, len(word)):
+            mid = len(word) - i
+            if len(heap) == k and split_bound(i, mid) < heap[0][0]:
+                continue
+            for n in index.get(word[i:], ()):
+                other = words[n]
+                if other == word:
+                    continue
+                entry = (portmanteau_score(i, mid, len(other) - mid), (-m, -i, -n))
+                if len(heap) < k:
+                    heapq.heappush(heap, entry + (word[:i] + other,))
+                elif entry > heap[0][:2]:
+                    heapq.heapreplace(heap, entry + (word[:i] + other,))
+    for (score, _, portmanteau) in sorted(heap, reverse=True)[done:]:
+        yield score, portmanteau
+
+def top_portmanteaux(path, k=10):
+    "The k best (score, portmanteau) pairs from the words of a word list file, best first."
+    return list(ranked_portmanteaux(read_words(path), k))
+
+def natalie_regex(words):
+    "natalie() as first written: a regex match for every word, split point and other word."
     possible_portmanteau = []
     for word in words:
         i = 1
@@ -82,22 +319,10 @@ def natalie(words):
     return best_portmanteau
 
 
-# More efficient algorithm to create portmanteau
 def natalie_efficient(words):
-    possible_portmanteau = []
-    words = deque(words)
-    i = 0
-    while(i < len(words)):
-        word = words.popleft() # use queues to prevent another loop.
-        for ow in words:
-            combined_word = word + ow
-            match = re.sub(r'(\w{2,})\1',r'\1',combined_word) # check for repeated words 2 or more in length
-            if len(match) != len(combined_word):
-                possible_portmanteau.append(match)
-        words.append(word)
-        i += 1
-    print possible_portmanteau 
-    
+    "natalie() with the automaton backend."
+    return natalie(words, 'automaton')
+
 def test_natalie():
     "Some test cases for natalie"
     assert natalie(['adolescent', 'scented', 'centennial', 'always', 'ado']) in ('adolescented','adolescentennial')
@@ -119,7 +344,85 @@ def test_natalie():
     assert natalie([]) == None
     return 'tests pass'
 
+def test_overlaps():
+    "overlaps() and automaton_overlaps() find what the regex search finds, in the same order."
+    import random
+    rng = random.Random(21)
+    assert list(overlaps(['ab', 'b', 'ab', 'bc'])) == 2 * [(1, 1, 0, 'ab', 'b'), (1, 1, 1, 'ab', 'bc')]
+    assert prefix_index(['ab', 'b', 'abc'])['ab'] == [0, 2]
+    assert portmanteau_score(5, 5, 2) == 8
+    assert list(automaton_overlaps(['ab', 'b', 'ab', 'bc'])) == list(overlaps(['ab', 'b', 'ab', 'bc']))
+    for _ in range(300):
+        words = [''.join(rng.choice('abc') for _ in range(rng.randint(0, 6))) for _ in range(rng.randint(0, 12))]
+        assert natalie(words) == natalie(words, 'automaton') == natalie_regex(words)
+        assert list(automaton_overlaps(words)) == list(overlaps(words))
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 12))) for _ in range(2000)]
+    assert natalie(words[:300]) == natalie_regex(words[:300]) and natalie(words) == natalie_efficient(words)
+    try:
+        natalie(words, 'regex')
+        assert False
+    except ValueError:
+        pass
+    return 'overlap tests pass'
+
+def test_bounded():
+    "natalie_bounded() picks what natalie() picks, ties and scores of 0 or less included."
+    import random
+    rng = random.Random(23)
+    assert natalie_bounded(['adolescent', 'scented', 'centennial', 'always', 'ado']) == natalie(['adolescent', 'scented', 'centennial', 'always', 'ado'])
+    assert natalie_bounded(['aaaaaaaaaab', 'b', 'bc']) == natalie(['aaaaaaaaaab', 'b', 'bc']) # only scores of 0 or less
+    assert natalie_bounded([]) is None and natalie_bounded(['night', 'day']) is None
+    for _ in range(500):
+        words = [''.join(rng.choice('ab') for _ in range(rng.randint(0, 9))) for _ in range(rng.randint(0, 10))]
+        assert natalie_bounded(words) == natalie(words)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 12))) for _ in range(3000)]
+    assert natalie_bounded(words) == natalie(words)
+    return 'bounded tests pass'
+
+def test_top():
+    "ranked_portmanteaux() agrees with ranking every candidate; top_portmanteaux() reads a file."
+    import os
+    import random
+    import tempfile
+    rng = random.Random(24)
+    def ranking(words, k):
+        candidates = list(overlaps(words))
+        order = sorted(range(len(candidates)), key=lambda c: (-portmanteau_score(*candidates[c][:3]), c))
+        return [(portmanteau_score(*candidates[c][:3]), candidates[c][3][:candidates[c][0]] + candidates[c][4]) for c in order[:k]]
+    for _ in range(300):
+        words = [''.join(rng.choice('abc') for _ in range(rng.randint(0, 8))) for _ in range(rng.randint(0, 12))]
+        k = rng.randint(1, 6)
+        assert list(ranked_portmanteaux(words, k)) == ranking(words, k)
+    words = ['adolescent', 'scented', 'centennial', 'always', 'ado', 'kimono', 'kimchee', 'cheese', 'serious', 'us']
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        with open(path, 'w') as f:
+            f.write('\n'.join(words) + '\n\n')
+        top = top_portmanteaux(path, 3)
+        assert top == ranking(words, 3) and top[0][1] == natalie(words)
+        assert list(ranked_portmanteaux(read_words(path), 0)) == []
+    finally:
+        os.remove(path)
+    return 'top tests pass'
+
+def test_parallel():
+    "natalie_parallel() picks what natalie() picks."
+    import random
+    rng = random.Random(25)
+    for _ in range(10):
+        words = [''.join(rng.choice('abc') for _ in range(rng.randint(0, 8))) for _ in range(rng.randint(0, 12))]
+        assert natalie_parallel(words, processes=2, shards=3) == natalie(words)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 12))) for _ in range(5000)]
+    assert natalie_parallel(words, processes=3) == natalie_parallel(words, processes=1, shards=1) == natalie(words)
+    assert natalie_parallel(['aaaaaaaaaab', 'b', 'bc'], processes=2) == natalie(['aaaaaaaaaab', 'b', 'bc'])
+    return 'parallel tests pass'
+
 if __name__ == '__main__':
     print test_natalie()
+    print test_overlaps()
+    print test_bounded()
+    print test_top()
+    print test_parallel()
 
 